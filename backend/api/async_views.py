@@ -0,0 +1,118 @@
+"""Асинхронные версии представлений для запуска под ASGI.
+
+Подключаются вместо синхронных при SERVER_MODE=asgi. Сами представления
+не держат поток, пока клиент медленно читает ответ; работа с ORM идет в
+отдельном пуле из ASYNC_DB_THREADS потоков, так что одновременно к базе
+обращается ограниченное число запросов.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .renderers import SHOPPING_LIST_RENDERERS
+from .shopping_list import shopping_list_rows, stream_shopping_list
+from .short_links import decode, recipe_path, resolve
+
+executor = None
+executor_lock = Lock()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_DB_THREADS,
+                thread_name_prefix='orm'
+            )
+    return executor
+
+
+def call_with_connection(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию с ORM в ограниченном пуле потоков.
+
+    Функция видит контекст запроса, в том числе его метрики.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), partial(
+            context.run, call_with_connection, func, *args, **kwargs
+        )
+    )
+
+
+def error_response(exc):
+    response = JsonResponse(
+        {'detail': exc.detail}, status=exc.status_code,
+        json_dumps_params={'ensure_ascii': False}
+    )
+    if isinstance(exc, exceptions.NotAuthenticated):
+        response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+async def redirect_to_full_link(request, code):
+    recipe_id = decode(code)
+    if recipe_id is not None and not settings.SHORT_LINK_CHECK_RECIPE:
+        return redirect(recipe_path(recipe_id))
+    path = await run_db(resolve, code)
+    if path is None:
+        return HttpResponse(
+            'Ссылка не найдена', status=status.HTTP_404_NOT_FOUND)
+    return redirect(path)
+
+
+def authenticated_user(request):
+    user = request.user
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return user
+
+
+async def download_shopping_cart(request):
+    if request.method != 'GET':
+        return error_response(exceptions.MethodNotAllowed(request.method))
+    request = Request(request, authenticators=[
+        authenticator() for authenticator
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        renderer, media_type = DefaultContentNegotiation().select_renderer(
+            request, [renderer() for renderer in SHOPPING_LIST_RENDERERS],
+            request.query_params.get(api_settings.URL_FORMAT_OVERRIDE)
+        )
+        user = await run_db(authenticated_user, request)
+    except exceptions.APIException as exc:
+        return error_response(exc)
+    # Список ограничен числом ингредиентов, поэтому читается целиком:
+    # в Django 3.2 потоковый ответ под ASGI перебирается в цикле событий,
+    # где ходить в базу нельзя.
+    rows = await run_db(lambda: list(shopping_list_rows(user)))
+    if not rows:
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(
+        stream_shopping_list(renderer.format, user, rows),
+        content_type=f'{renderer.media_type}; charset=utf-8'
+    )
+    filename = f'{user.username}_shopping_list.{renderer.format}'
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
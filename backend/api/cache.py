@@ -0,0 +1,260 @@
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date
+
+from .metrics import API_CACHE_EVENTS
+
+PREFIX = 'api-cache'
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def check_shared_cache(workers):
+    """Не дает запустить сервер с кэшем процесса там, где нужен общий.
+
+    Вызывается из gunicorn.conf.py при старте сервера; manage.py и
+    runserver с кэшем в памяти работают как прежде. Версия тега,
+    поднятая в одном воркере, должна быть видна остальным: иначе они
+    продолжают отдавать старые ответы и 304 со старым ETag. Документы
+    рецептов (RECIPE_ROWS_SERIALIZER) живут в кэше до суток и меняются
+    еще и командами manage.py, поэтому им общий кэш нужен даже при одном
+    воркере.
+    """
+    backend = settings.CACHES[settings.API_CACHE_ALIAS]['BACKEND']
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return
+    if workers > 1:
+        raise ImproperlyConfigured(
+            f'Кэш API {backend} не общий для воркеров '
+            f'(GUNICORN_WORKERS={workers}): укажите в CACHE_BACKEND '
+            'файловый кэш или memcached либо запустите один воркер'
+        )
+    if settings.RECIPE_ROWS_SERIALIZER:
+        raise ImproperlyConfigured(
+            f'Документы рецептов нельзя хранить в кэше {backend}: укажите '
+            'в CACHE_BACKEND файловый кэш или memcached либо выключите '
+            'RECIPE_ROWS_SERIALIZER'
+        )
+
+
+def version_key(tag):
+    return f'{PREFIX}:version:{tag}'
+
+
+def modified_key(tag):
+    return f'{PREFIX}:modified:{tag}'
+
+
+def bump(*tags):
+    """Меняет версии тегов: закэшированные по ним ответы перестают читаться.
+
+    Новая версия — случайный токен, а не incr(): в файловом кэше incr не
+    атомарен, и два процесса могли бы записать одну и ту же версию. Рядом
+    запоминается время изменения для заголовка Last-Modified.
+    """
+    now = time.time()
+    get_cache().set_many(
+        {
+            **{version_key(tag): uuid.uuid4().hex for tag in tags},
+            **{modified_key(tag): now for tag in tags},
+        },
+        None
+    )
+
+
+def current_versions(tags):
+    cache = get_cache()
+    keys = [version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def request_fingerprint(request, *parts):
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    raw = '|'.join((
+        request.path,
+        query,
+        request.accepted_renderer.format,
+        *map(str, parts),
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def response_key(request, tags):
+    fingerprint = request_fingerprint(request, *current_versions(tags))
+    return f'{PREFIX}:response:{fingerprint}'
+
+
+def validators(request, tags):
+    """ETag и Last-Modified ответа по версиям тегов, без запросов к базе.
+
+    Теги неизвестной давности считаются измененными сейчас. Last-Modified
+    не отдается, пока идет секунда последнего изменения: иначе изменение
+    в ту же секунду не было бы видно по If-Modified-Since.
+    """
+    cache = get_cache()
+    now = time.time()
+    keys = [modified_key(tag) for tag in tags]
+    modified = cache.get_many(keys)
+    for key in keys:
+        if key not in modified:
+            cache.add(key, now, None)
+            modified[key] = cache.get(key, now)
+    last_modified = int(max(modified.values(), default=now))
+    if last_modified >= int(now):
+        last_modified = None
+    etag = quote_etag(request_fingerprint(
+        request, request.user.pk, *current_versions(tags)
+    ))
+    return etag, last_modified
+
+
+def count(event):
+    """Учитывает попадание или промах в памяти процесса.
+
+    В кэш при попадании ничего не пишется: в файловом кэше каждая запись
+    обходит весь каталог, и счетчик был бы дороже самого ответа.
+    """
+    API_CACHE_EVENTS.inc(event)
+
+
+def get_stats():
+    return {
+        event: API_CACHE_EVENTS.get(event) for event in ('hits', 'misses')
+    }
+
+
+def from_entry(entry):
+    fresh_until, status, headers, content = entry
+    return HttpResponse(content, status=status, headers=headers)
+
+
+def cached_response(request, tags, render):
+    """Отдает ответ из кэша или строит его через render() и сохраняет.
+
+    Запись свежая API_CACHE_TIMEOUT секунд и еще столько же хранится как
+    устаревшая. Строит новый ответ только процесс, взявший блокировку
+    ключа; остальные не ждут: отдают устаревшую запись, если она есть, а
+    иначе строят ответ сами, не сохраняя его. Устаревшая запись собрана
+    при тех же версиях тегов, то есть отличается от новой только возрастом.
+    """
+    cache = get_cache()
+    key = response_key(request, tags)
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        count('hits')
+        return from_entry(entry)
+    locked = cache.add(f'{key}:lock', 1, settings.API_CACHE_LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        count('hits')
+        return from_entry(entry)
+
+    count('misses')
+    try:
+        response = render()
+        if locked and response.status_code == 200:
+            cache.set(
+                key,
+                (
+                    time.time() + settings.API_CACHE_TIMEOUT,
+                    response.status_code,
+                    dict(response.items()),
+                    response.content,
+                ),
+                settings.API_CACHE_TIMEOUT * 2
+            )
+    finally:
+        if locked:
+            cache.delete(f'{key}:lock')
+    return response
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на If-None-Match и If-Modified-Since в list и retrieve.
+
+    Проверка идет до queryset и сериализатора: ETag строится из версий
+    тегов cache_tags() и, для вошедшего пользователя, user_cache_tags(),
+    поэтому персональные поля ответа тоже учитываются.
+    """
+
+    def cache_tags(self):
+        raise NotImplementedError
+
+    def user_cache_tags(self, user):
+        return ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        tags = tuple(self.cache_tags())
+        if request.user.is_authenticated:
+            tags += tuple(self.user_cache_tags(request.user))
+        etag, last_modified = validators(request, tags)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AnonymousCacheMixin:
+    """Кэширует list и retrieve для анонимных пользователей.
+
+    Вьюсет указывает в cache_tags(), от каких данных зависит ответ,
+    сигналы из api.signals меняют версии этих тегов при записи.
+    """
+
+    def cache_tags(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+
+        def render():
+            response = self.finalize_response(
+                request, handler(request, *args, **kwargs), *args, **kwargs
+            )
+            return response.render()
+
+        return cached_response(request, self.cache_tags(), render)
@@ -1,10 +1,9 @@
-import random
-import string
-
+from django import forms
 from django.contrib.auth import get_user_model
-from django.contrib.sites.models import Site
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, NumberFilter, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.catalogue import tag_catalogue
+from recipes.models import Ingredient, Recipe
 
 User = get_user_model()
 
@@ -20,12 +19,26 @@ class IngredientFilter(FilterSet):
         fields = ['name']
 
 
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in tag_catalogue.snapshot().tags]
+
+
+class TagSlugsField(forms.MultipleChoiceField):
+    """Слаги тегов, проверенные по каталогу тегов процесса, без запросов."""
+
+    def valid_value(self, value):
+        return tag_catalogue.get_by_slug(value) is not None
+
+
+class TagSlugsFilter(filters.MultipleChoiceFilter):
+    field_class = TagSlugsField
+
+
 class RecipeFilter(FilterSet):
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = TagSlugsFilter(
+        choices=tag_choices,
+        method='filter_tags',
     )
     author = NumberFilter(field_name="author__id"),
     is_favorited = filters.BooleanFilter(
@@ -34,11 +47,21 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        tags = map(tag_catalogue.get_by_slug, value)
+        tag_ids = [tag.pk for tag in tags if tag is not None]
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag_id__in=tag_ids
+            )
+        ))
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -51,10 +74,8 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=user)
         return queryset
 
-
-def get_short_url():
-    characters = string.ascii_letters + string.digits
-    short_url = ''.join(random.choices(characters, k=4))
-    current_site = Site.objects.get_current()
-    current_domain = current_site.domain
-    return f"http://{current_domain}/s/{short_url}"
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if value:
+            return queryset.search(value)
+        return queryset
@@ -0,0 +1,315 @@
+"""Метрики запросов: число и время SQL, сериализация, общая задержка.
+
+Значения копятся в гистограммах процесса по имени представления
+(например, RecipeViewSet.list) и отдаются в текстовом формате Prometheus.
+Каждый воркер gunicorn считает свои метрики, Prometheus собирает их по
+отдельности.
+
+Запросы к базе считает обертка, которую ApiConfig.ready() ставит на
+каждое соединение при его открытии; она пишет в метрики из
+current_metrics. Соединения в Django свои у каждого потока, поэтому так
+учитываются и запросы из пула потоков асинхронных представлений: run_db
+переносит туда контекст.
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+PROJECT_DIR = str(Path(settings.BASE_DIR))
+
+
+class RequestMetrics:
+    """Счетчики одного запроса; вызывается как execute_wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.templates = defaultdict(int)
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.templates[sql] += 1
+            if sql not in self.call_sites:
+                self.call_sites[sql] = call_site()
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def repeated_templates(self, threshold):
+        return [
+            (sql, count, self.call_sites[sql])
+            for sql, count in self.templates.items()
+            if count >= threshold
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: пишет в метрики текущего запроса."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def call_site():
+    """Первый кадр стека из кода проекта, а не из Django или библиотек."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and 'site-packages' not in (
+            filename
+        ) and filename != __file__:
+            return f'{filename}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'неизвестно'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.lock = Lock()
+        self.series = {}
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.setdefault(
+                label, {'buckets': [0] * len(self.buckets), 'sum': 0.0,
+                        'count': 0}
+            )
+            for number, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][number] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def export(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            for label, series in sorted(self.series.items()):
+                view = label.replace('\\', '\\\\').replace('"', '\\"')
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(
+                        f'{self.name}_bucket{{view="{view}",le="{bound}"}} '
+                        f'{count}'
+                    )
+                lines.append(
+                    f'{self.name}_bucket{{view="{view}",le="+Inf"}} '
+                    f'{series["count"]}'
+                )
+                lines.append(
+                    f'{self.name}_sum{{view="{view}"}} {series["sum"]}'
+                )
+                lines.append(
+                    f'{self.name}_count{{view="{view}"}} {series["count"]}'
+                )
+        return lines
+
+
+class EventCounter:
+    """Счетчик событий процесса по метке; без записи в общий кэш."""
+
+    def __init__(self, name, documentation, label):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.lock = Lock()
+        self.values = defaultdict(int)
+
+    def inc(self, value):
+        with self.lock:
+            self.values[value] += 1
+
+    def get(self, value):
+        with self.lock:
+            return self.values[value]
+
+    def export(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self.lock:
+            for value, count in sorted(self.values.items()):
+                lines.append(
+                    f'{self.name}{{{self.label}="{value}"}} {count}'
+                )
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Полное время обработки запроса.',
+    DURATION_BUCKETS
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Время SQL-запросов за запрос.',
+    DURATION_BUCKETS
+)
+SERIALIZER_DURATION = Histogram(
+    'foodgram_serializer_duration_seconds',
+    'Время сериализации ответа, включая запросы из сериализаторов.',
+    DURATION_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries',
+    'Число SQL-запросов за запрос.',
+    QUERY_BUCKETS
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, SERIALIZER_DURATION, DB_QUERIES)
+API_CACHE_EVENTS = EventCounter(
+    'foodgram_api_cache_events_total',
+    'Попадания (hits) и промахи (misses) кэша ответов API.',
+    'event'
+)
+
+
+def observe(view, metrics):
+    total = metrics.total_time
+    REQUEST_DURATION.observe(view, total)
+    DB_DURATION.observe(view, metrics.db_time)
+    SERIALIZER_DURATION.observe(view, metrics.serializer_time)
+    DB_QUERIES.observe(view, metrics.queries)
+    for sql, count, site in metrics.repeated_templates(
+        settings.METRICS_REPEATED_QUERY_THRESHOLD
+    ):
+        logger.warning(
+            'Похоже на N+1 в %s: запрос выполнен %s раз, %s\n%s',
+            view, count, site, sql
+        )
+    return total
+
+
+def server_timing(metrics, total):
+    return ', '.join((
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} SQL"',
+        f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ))
+
+
+def instrument_serializers():
+    """Учитывает время BaseSerializer.data внешнего сериализатора."""
+    data = BaseSerializer.data.fget
+    if getattr(data, 'instrumented', False):
+        return
+
+    def timed_data(serializer):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return data(serializer)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+def metrics_view(request):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.export())
+    lines.extend(API_CACHE_EVENTS.export())
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+def view_name(request):
+    """Имя представления и действия: RecipeViewSet.list, GetShortLink.get."""
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return getattr(match.func, '__name__', match.view_name)
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{view.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса и добавляет заголовок Server-Timing.
+
+    Работает и в синхронной, и в асинхронной цепочке: под ASGI запрос не
+    переводится ради метрик в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        instrument_serializers()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    @staticmethod
+    def finish(request, response, metrics):
+        total = observe(view_name(request), metrics)
+        response['Server-Timing'] = server_timing(metrics, total)
+        return response
@@ -1,6 +1,115 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 7
     page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    """Постраничная пагинация с включаемым режимом курсора.
+
+    ?pagination=cursor или ?cursor=<токен> переключают выдачу на ключ
+    (pub_date, id): страница выбирается условием по ключу вместо OFFSET,
+    а ответ не содержит count, поэтому любая страница стоит как первая.
+    Выдача поиска (?search=) упорядочена по релевантности, которой нет в
+    ключе, поэтому она всегда разбивается на страницы по номерам.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    search_query_param = 'search'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        ) and not request.query_params.get(
+            self.search_query_param, ''
+        ).strip()
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            queryset = queryset.order_by('pub_date', 'id')
+            if position is not None:
+                queryset = queryset.filter(self.after(*position, 'gt'))
+        else:
+            queryset = queryset.order_by('-pub_date', '-id')
+            if position is not None:
+                queryset = queryset.filter(self.after(*position, 'lt'))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        self.next_position = self.previous_position = None
+        if results:
+            first = self.position(results[0])
+            last = self.position(results[-1])
+            if reverse:
+                self.next_position = last
+                self.previous_position = first if has_more else None
+            else:
+                self.next_position = last if has_more else None
+                self.previous_position = first if position else None
+        return results
+
+    @staticmethod
+    def position(item):
+        """Ключ (pub_date, id) рецепта или строки values()."""
+        if isinstance(item, dict):
+            return item['pub_date'], item['id']
+        return item.pub_date, item.pk
+
+    @staticmethod
+    def after(pub_date, pk, lookup):
+        return (
+            Q(**{f'pub_date__{lookup}': pub_date})
+            | Q(pub_date=pub_date, **{f'id__{lookup}': pk})
+        )
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            value = urlsafe_b64decode(token.encode()).decode()
+            direction, pub_date, pk = value.split('|')
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None or direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return (pub_date, pk), direction == 'p'
+
+    def encode_cursor(self, position, direction):
+        if position is None:
+            return None
+        pub_date, pk = position
+        token = urlsafe_b64encode(
+            f'{direction}|{pub_date.isoformat()}|{pk}'.encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.encode_cursor(self.next_position, 'n'),
+            'previous': self.encode_cursor(self.previous_position, 'p'),
+            'results': data,
+        })
@@ -0,0 +1,75 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import (FileUploadParser, JSONParser,
+                                    MultiPartParser)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson; без orjson — обычный JSONParser.
+
+    orjson, как и JSONParser при STRICT_JSON, не принимает NaN и Infinity
+    и работает только с UTF-8, для других кодировок остается json.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get(
+            'encoding', settings.DEFAULT_CHARSET
+        )
+        if (
+            orjson is None or not self.strict
+            or encoding.lower().replace('_', '-') != 'utf-8'
+        ):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+class ContentLengthLimitMixin:
+    """Отклоняет запрос по Content-Length, не читая тело."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise PayloadTooLarge()
+        return super().parse(stream, media_type, parser_context)
+
+
+class ImageMultiPartParser(ContentLengthLimitMixin, MultiPartParser):
+    pass
+
+
+class ImageUploadParser(ContentLengthLimitMixin, FileUploadParser):
+    """Тело запроса целиком — файл изображения, например image/png.
+
+    Файл попадает в request.data['file'], большие файлы Django сразу
+    пишет на диск.
+    """
+
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        return 'photo.' + media_type.split(';')[0].split('/')[-1]
+
+
+IMAGE_PARSERS = (FastJSONParser, ImageMultiPartParser, ImageUploadParser)
@@ -0,0 +1,235 @@
+"""Быстрое чтение рецептов: готовые документы и флаги пользователя.
+
+Все, что в ответе RecipeSerializer не зависит от читателя, — теги,
+ингредиенты, карточка автора, ссылка на картинку — собирается заранее в
+документ рецепта и лежит в кэше API. Документ действителен, пока не
+изменились версии тегов кэша recipe:<id>, tags и ingredients, которые
+поднимают сигналы из api/signals.py. При чтении базе остается выбрать
+id страницы вместе с флагами with_user_flags(), а ответ получается
+наложением флагов и абсолютных ссылок на документы. Совпадение с
+RecipeSerializer проверяет команда check_recipe_rows.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404
+from recipes.bulk import batches
+from recipes.models import IngredientInRecipe, Recipe
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from user.models import User
+
+from .cache import PREFIX, current_versions, get_cache
+
+PAGE_FIELDS = (
+    'id', 'pub_date', 'is_favorited', 'is_in_shopping_cart',
+    'author_is_subscribed',
+)
+RECIPE_FIELDS = ('id', 'name', 'image', 'text', 'cooking_time')
+AUTHOR_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'avatar',
+)
+SHARED_TAGS = ('tags', 'ingredients')
+REFRESH_BATCH_SIZE = 500
+
+
+def recipe_values(queryset):
+    """Строки страницы: id, дата и флаги; queryset с with_user_flags()."""
+    return queryset.prefetch_related(None).values(*PAGE_FIELDS)
+
+
+def file_url(field, name):
+    """Ссылка на файл как в FileField; абсолютной ее делает absolute()."""
+    if not name:
+        return None
+    return field.storage.url(name)
+
+
+def absolute(url, request):
+    if url is None or request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def document_key(recipe_id):
+    return f'{PREFIX}:recipe-document:{recipe_id}'
+
+
+def document_tags(recipe_id):
+    return (f'recipe:{recipe_id}', *SHARED_TAGS)
+
+
+def document_tag_rows(recipe_ids):
+    return Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag_id').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__slug'
+    )
+
+
+def document_ingredient_rows(recipe_ids):
+    return IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    )
+
+
+def document_recipe_rows(recipe_ids):
+    return Recipe.objects.filter(pk__in=recipe_ids).order_by().values(
+        *RECIPE_FIELDS, *(f'author__{field}' for field in AUTHOR_FIELDS)
+    )
+
+
+def build_documents(recipe_ids):
+    """Документы рецептов из базы: три запроса на любое число рецептов."""
+    tags = defaultdict(list)
+    for recipe_id, *tag in document_tag_rows(recipe_ids):
+        tags[recipe_id].append(dict(zip(('id', 'name', 'slug'), tag)))
+    ingredients = defaultdict(list)
+    for recipe_id, *ingredient in document_ingredient_rows(recipe_ids):
+        ingredients[recipe_id].append(
+            dict(zip(('id', 'name', 'measurement_unit', 'amount'),
+                     ingredient))
+        )
+    image_field = Recipe._meta.get_field('image')
+    avatar_field = User._meta.get_field('avatar')
+    return {
+        row['id']: {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': None if row['author__id'] is None else {
+                'id': row['author__id'],
+                'username': row['author__username'],
+                'email': row['author__email'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'avatar': file_url(avatar_field, row['author__avatar']),
+            },
+            'ingredients': ingredients[row['id']],
+            'name': row['name'],
+            'image': file_url(image_field, row['image']),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+        for row in document_recipe_rows(recipe_ids)
+    }
+
+
+def store_documents(recipe_ids, versions):
+    """Собирает документы и кладет в кэш с версиями, прочитанными до сборки.
+
+    Если рецепт изменится во время сборки, документ ляжет со старыми
+    версиями и при следующем чтении будет собран заново.
+    """
+    documents = build_documents(recipe_ids)
+    get_cache().set_many(
+        {
+            document_key(pk): (versions[pk], document)
+            for pk, document in documents.items()
+        },
+        settings.RECIPE_DOCUMENT_TIMEOUT
+    )
+    return documents
+
+
+def versions_of(recipe_ids):
+    tags = list({tag for pk in recipe_ids for tag in document_tags(pk)})
+    versions = dict(zip(tags, current_versions(tags)))
+    return {
+        pk: tuple(versions[tag] for tag in document_tags(pk))
+        for pk in recipe_ids
+    }
+
+
+def refresh_documents(recipe_ids):
+    """Пересобирает документы; вызывать после commit и поднятия версий."""
+    for batch in batches(recipe_ids, REFRESH_BATCH_SIZE):
+        store_documents(batch, versions_of(batch))
+
+
+def recipe_documents(recipe_ids):
+    """Документы по id: из кэша, а устаревшие и недостающие — из базы."""
+    versions = versions_of(recipe_ids)
+    cached = get_cache().get_many(
+        [document_key(pk) for pk in recipe_ids]
+    )
+    documents, stale = {}, []
+    for pk in recipe_ids:
+        entry = cached.get(document_key(pk))
+        if entry is not None and entry[0] == versions[pk]:
+            documents[pk] = entry[1]
+        else:
+            stale.append(pk)
+    if stale:
+        documents.update(store_documents(stale, versions))
+    return documents
+
+
+def overlay(document, row, request):
+    """Ответ RecipeSerializer: документ, флаги строки и абсолютные ссылки.
+
+    У рецепта удаленного автора (SET_NULL) author — null, как у
+    RecipeSerializer.
+    """
+    author = document['author']
+    if author is not None:
+        author = {
+            **author,
+            'avatar': absolute(author['avatar'], request),
+            'is_subscribed': row['author_is_subscribed'],
+        }
+    return {
+        'id': document['id'],
+        'tags': document['tags'],
+        'author': author,
+        'ingredients': document['ingredients'],
+        'is_favorited': row['is_favorited'],
+        'is_in_shopping_cart': row['is_in_shopping_cart'],
+        'name': document['name'],
+        'image': absolute(document['image'], request),
+        'text': document['text'],
+        'cooking_time': document['cooking_time'],
+    }
+
+
+def serialize_recipes(rows, request):
+    """Словари в форме RecipeSerializer для строк recipe_values()."""
+    documents = recipe_documents([row['id'] for row in rows])
+    return [
+        overlay(documents[row['id']], row, request)
+        for row in rows if row['id'] in documents
+    ]
+
+
+class RecipeRowsMixin:
+    """list и retrieve рецептов через serialize_recipes().
+
+    Включается настройкой RECIPE_ROWS_SERIALIZER; queryset вьюсета должен
+    быть аннотирован with_user_flags().
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RECIPE_ROWS_SERIALIZER:
+            return super().list(request, *args, **kwargs)
+        queryset = recipe_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serialize_recipes(page, request)
+            )
+        return Response(serialize_recipes(list(queryset), request))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.RECIPE_ROWS_SERIALIZER:
+            return super().retrieve(request, *args, **kwargs)
+        row = get_object_or_404(
+            recipe_values(self.filter_queryset(self.get_queryset())),
+            pk=self.kwargs['pk']
+        )
+        recipes = serialize_recipes([row], request)
+        if not recipes:
+            # Рецепт удалили между выборкой строки и сборкой документа.
+            raise Http404
+        return Response(recipes[0])
@@ -0,0 +1,72 @@
+"""Флаги текущего пользователя на время одного запроса.
+
+Подписки, избранное и корзина читаются не EXISTS на каждый объект, а
+одним запросом на вид связи: сериализаторы списков заранее сообщают id
+объектов страницы, и при первом вопросе о флаге читаются связи
+пользователя только с этими id. Для анонима запросов нет совсем.
+"""
+from django.db.models import Manager
+from recipes.models import Favourite, ShoppingCart
+from rest_framework.serializers import ListSerializer
+from user.models import Subscribe
+
+RELATIONS = {
+    'subscribed': (Subscribe, 'author_id'),
+    'favorited': (Favourite, 'recipe_id'),
+    'in_shopping_cart': (ShoppingCart, 'recipe_id'),
+}
+
+
+class UserRelations:
+    """Множества id, с которыми связан пользователь, по видам связи."""
+
+    def __init__(self, user):
+        if user is not None and user.is_anonymous:
+            user = None
+        self.user = user
+        self.pending = {relation: set() for relation in RELATIONS}
+        self.checked = {relation: set() for relation in RELATIONS}
+        self.found = {relation: set() for relation in RELATIONS}
+
+    def expect(self, relation, ids):
+        """Запоминает id, о которых скоро спросят; сам запрос не делает."""
+        if self.user is not None:
+            self.pending[relation].update(ids)
+
+    def has(self, relation, pk):
+        if self.user is None:
+            return False
+        if pk not in self.checked[relation]:
+            ids = (self.pending[relation] | {pk}) - self.checked[relation]
+            model, field = RELATIONS[relation]
+            self.found[relation].update(model.objects.filter(
+                user=self.user, **{f'{field}__in': ids}
+            ).values_list(field, flat=True))
+            self.checked[relation] |= ids
+            self.pending[relation].clear()
+        return pk in self.found[relation]
+
+
+def user_relations(request):
+    """UserRelations текущего запроса; без запроса — как для анонима."""
+    if request is None:
+        return UserRelations(None)
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = request._user_relations = UserRelations(request.user)
+    return relations
+
+
+class RelationsListSerializer(ListSerializer):
+    """Перед выводом списка передает дочернему сериализатору его объекты.
+
+    Дочерний сериализатор объявляет expect_relations(relations, items)
+    и сообщает в нем, о каких id будет спрашивать.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        self.child.expect_relations(
+            user_relations(self.context.get('request')), items
+        )
+        return super().to_representation(items)
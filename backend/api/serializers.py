@@ -1,11 +1,17 @@
+from api.recipe_rows import refresh_documents
+from api.relations import RelationsListSerializer, user_relations
 from api.utils import Base64ImageField
+from django.db import transaction
 from django.forms import ValidationError
 from djoser.serializers import UserSerializer
-from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Link,
-                            Recipe, ShoppingCart, Tag)
+from recipes.catalogue import tag_catalogue
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
 from rest_framework import serializers
 from user.models import Subscribe, User
 
+MAX_BULK_RECIPES = 100
+
 
 class UserAvatarSerialiser(serializers.ModelSerializer):
     avatar = Base64ImageField(allow_null=True, required=False)
@@ -35,15 +41,17 @@ class CustomUserSerializer(UserSerializer):
             'avatar',
             'is_subscribed',
         )
+        list_serializer_class = RelationsListSerializer
+
+    def expect_relations(self, relations, users):
+        relations.expect('subscribed', [user.pk for user in users])
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(
-            user=request.user,
-            author=obj
-        ).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return user_relations(self.context.get('request')).has(
+            'subscribed', obj.pk
+        )
 
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
@@ -113,20 +121,35 @@ class RecipeSerializer(serializers.ModelSerializer):
             'text',
             'cooking_time',
         )
+        list_serializer_class = RelationsListSerializer
+
+    def expect_relations(self, relations, recipes):
+        recipe_ids = [recipe.pk for recipe in recipes]
+        relations.expect('favorited', recipe_ids)
+        relations.expect('in_shopping_cart', recipe_ids)
+        relations.expect(
+            'subscribed', [recipe.author_id for recipe in recipes]
+        )
 
-    def check_if_exists(self, obj, model):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return model.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+    def to_representation(self, instance):
+        if instance.author and hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def check_if_exists(self, obj, relation, annotation):
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
+        return user_relations(self.context.get('request')).has(
+            relation, obj.pk
+        )
 
     def get_is_favorited(self, obj):
-        return self.check_if_exists(obj, Favourite)
+        return self.check_if_exists(obj, 'favorited', 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.check_if_exists(obj, ShoppingCart)
+        return self.check_if_exists(
+            obj, 'in_shopping_cart', 'is_in_shopping_cart'
+        )
 
 
 class CreateIngredientsInRecipeSerializer(serializers.ModelSerializer):
@@ -146,8 +169,23 @@ class CreateIngredientsInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class CatalogueTagField(serializers.PrimaryKeyRelatedField):
+    """id тега, проверенный по каталогу тегов процесса, а не запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = tag_catalogue.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = CatalogueTagField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -194,26 +232,33 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 }
             )
 
-        ingredient_list = []
-        for item in ingredients:
-            try:
-                ingredient = Ingredient.objects.get(pk=item['id'])
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    'Введен не существующий ингредиент'
-                )
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингридиенты должны быть уникальными'
-                )
-            ingredient_list.append(ingredient)
-            if int(item['amount']) < 1:
-                raise serializers.ValidationError(
-                    {
-                        'ingredients':
-                        ('Значение ингредиента должно быть больше 0')
-                    }
-                )
+        try:
+            ingredients = [
+                {'id': int(item['id']), 'amount': int(item['amount'])}
+                for item in ingredients
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите id и количество ингредиента'}
+            )
+        ingredient_ids = [item['id'] for item in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингридиенты должны быть уникальными'
+            )
+        if len(Ingredient.objects.in_bulk(ingredient_ids)) != len(
+            ingredient_ids
+        ):
+            raise serializers.ValidationError(
+                'Введен не существующий ингредиент'
+            )
+        if any(item['amount'] < 1 for item in ingredients):
+            raise serializers.ValidationError(
+                {
+                    'ingredients':
+                    ('Значение ингредиента должно быть больше 0')
+                }
+            )
         data['ingredients'] = ingredients
         image = self.initial_data.get('image')
         if not image:
@@ -223,18 +268,56 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for element in ingredients:
-            id = element['id']
-            ingredient = Ingredient.objects.get(pk=id)
-            amount = element['amount']
-            IngredientInRecipe.objects.create(
-                ingredient=ingredient, recipe=recipe,
-                amount=amount
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient_id=item['id'],
+                amount=item['amount']
             )
+            for item in ingredients
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        """Записывает только изменившиеся строки, возвращает разницу."""
+        current = {
+            item.ingredient_id: item
+            for item in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        to_create, to_update = [], []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                to_create.append(IngredientInRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+            elif item.amount != amount:
+                item.amount = amount
+                to_update.append(item)
+        IngredientInRecipe.objects.bulk_create(to_create)
+        IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientInRecipe.objects.filter(
+            pk__in=[
+                item.pk for ingredient_id, item in current.items()
+                if ingredient_id not in amounts
+            ]
+        ).delete()
+        return {
+            ingredient_id: (
+                amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in amounts.keys() | old_amounts.keys()
+        }
 
     def create_tags(self, tags, recipe):
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -242,39 +325,45 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data, author=user)
         self.create_ingredients(ingredients, recipe)
         self.create_tags(tags, recipe)
+        transaction.on_commit(lambda: refresh_documents([recipe.pk]))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        IngredientInRecipe.objects.filter(
-            recipe=instance
-        ).delete()
-        self.create_ingredients(
-            validated_data.pop('ingredients'),
-            instance
+        ShoppingListItem.objects.apply_deltas(
+            ShoppingCart.objects.filter(
+                recipe=instance
+            ).values_list('user_id', flat=True),
+            self.update_ingredients(
+                validated_data.pop('ingredients'),
+                instance
+            )
         )
-        return super().update(
+        recipe = super().update(
             instance,
             validated_data
         )
+        transaction.on_commit(lambda: refresh_documents([recipe.pk]))
+        return recipe
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user if request else None
+        ).get(pk=instance.pk)
         serializer = RecipeSerializer(
             instance,
-            context={
-                'request': self.context.get('request')
-            }
+            context={'request': request}
         )
         return serializer.data
 
 
-class ShortLinkSerialiser(serializers.ModelSerializer):
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = Base64ImageField()
 
     class Meta:
-        model = Link
-        fields = ('short_link',)
-
-    def to_representation(self, instance):
-        return {'short-link': instance.short_link}
+        model = Recipe
+        fields = ('image',)
 
 
 class RecipesShortSerializer(serializers.ModelSerializer):
@@ -287,6 +376,21 @@ class RecipesShortSerializer(serializers.ModelSerializer):
                   'cooking_time',)
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit', '')
+    if recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
+
+
 class SubscriptionsSerializer(CustomUserSerializer):
     email = serializers.ReadOnlyField(source="author.email")
     id = serializers.ReadOnlyField(source="author.id")
@@ -313,29 +417,39 @@ class SubscriptionsSerializer(CustomUserSerializer):
             "recipes_count",
             "avatar"
         )
+        list_serializer_class = RelationsListSerializer
+
+    def expect_relations(self, relations, subscriptions):
+        relations.expect(
+            'subscribed',
+            [subscription.author_id for subscription in subscriptions]
+        )
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
-        serializer = RecipeSerializer(
-            queryset,
+        previews = self.context.get('recipe_previews')
+        if previews is not None:
+            recipes = previews.get(obj.author_id, [])
+        else:
+            recipes = Recipe.objects.filter(author=obj.author)
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+        serializer = RecipesShortSerializer(
+            recipes,
             many=True,
             context={'request': request}
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
-        return Subscribe.objects.filter(
-            author=obj.author,
-            user=request.user
-        ).exists()
+        if obj.user_id == request.user.id:
+            return True
+        return user_relations(request).has('subscribed', obj.author_id)
 
 
 class SubscribedSerislizer(serializers.ModelSerializer):
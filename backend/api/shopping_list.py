@@ -0,0 +1,73 @@
+import csv
+import json
+
+from django.db.models import Sum
+from recipes.models import ShoppingListItem
+
+FIELDS = ('name', 'measurement_unit', 'amount')
+ROWS_PER_CHUNK = 200
+
+
+def shopping_list_rows(user):
+    """Список покупок пользователя: (название, ед. измерения, количество).
+
+    Как и раньше, строки складываются по названию и единице измерения:
+    одноименные ингредиенты с разными id дают одну строку.
+    """
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def txt_lines(user, rows):
+    yield f'Список покупок для: {user.get_full_name()}\n\n'
+    for number, (name, measurement_unit, amount) in enumerate(rows):
+        separator = '\n' if number else ''
+        yield f'{separator}- {name} ({measurement_unit}) - {amount}'
+
+
+def csv_lines(user, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_lines(user, rows):
+    yield '['
+    for number, row in enumerate(rows):
+        separator = ',' if number else ''
+        yield separator + json.dumps(dict(zip(FIELDS, row)),
+                                     ensure_ascii=False)
+    yield ']'
+
+
+WRITERS = {
+    'txt': txt_lines,
+    'csv': csv_lines,
+    'json': json_lines,
+}
+
+
+def stream_shopping_list(format, user, rows):
+    """Отдает документ частями, не собирая его целиком в памяти."""
+    chunk = []
+    for line in WRITERS[format](user, rows):
+        chunk.append(line)
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
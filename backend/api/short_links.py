@@ -0,0 +1,153 @@
+"""Короткие ссылки на рецепты без хранения в базе.
+
+Код — это id рецепта, переставленный ключевой сетью Фейстеля на 32-битном
+пространстве и записанный в base62 фиксированной длины. Перестановка
+обратима, поэтому код раскрывается в id без запроса к базе, а разные
+рецепты никогда не получают одинаковый код. Ключ перестановки — настройка
+SHORT_LINK_KEY, а не SECRET_KEY: смена SECRET_KEY не должна ломать уже
+выданные ссылки.
+"""
+import hashlib
+import hmac
+import string
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from recipes.models import Link, Recipe
+
+from .cache import PREFIX, current_versions, get_cache, version_key
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 6
+LEGACY_CODE_LENGTH = 4
+HALF_BITS = 16
+HALF_MASK = (1 << HALF_BITS) - 1
+MAX_ID = 1 << (2 * HALF_BITS)
+ROUNDS = 4
+
+
+@lru_cache(maxsize=1)
+def round_keys(secret):
+    return [
+        hmac.new(
+            secret.encode(), f'short-link-{number}'.encode(), hashlib.sha256
+        ).digest()
+        for number in range(ROUNDS)
+    ]
+
+
+def round_function(value, key):
+    digest = hmac.new(key, value.to_bytes(2, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:2], 'big')
+
+
+def permute(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in keys:
+        left, right = right, left ^ round_function(right, key)
+    return (left << HALF_BITS) | right
+
+
+def unpermute(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in reversed(keys):
+        left, right = right ^ round_function(left, key), left
+    return (left << HALF_BITS) | right
+
+
+def encode(recipe_id):
+    if not 0 < recipe_id < MAX_ID:
+        raise ValueError('id рецепта вне диапазона коротких ссылок')
+    value = permute(recipe_id, round_keys(settings.SHORT_LINK_KEY))
+    code = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        code.append(ALPHABET[digit])
+    return ''.join(reversed(code))
+
+
+def decode(code):
+    """id рецепта по коду или None, если код не из этой схемы."""
+    if len(code) != CODE_LENGTH:
+        return None
+    value = 0
+    for char in code:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            return None
+        value = value * len(ALPHABET) + digit
+    if value >= MAX_ID:
+        return None
+    return unpermute(value, round_keys(settings.SHORT_LINK_KEY)) or None
+
+
+def recipe_path(recipe_id):
+    return f'/recipes/{recipe_id}'
+
+
+def resolve(code):
+    """Путь страницы рецепта по коду или None, если ссылки нет."""
+    recipe_id = decode(code)
+    if recipe_id is not None and (
+        not settings.SHORT_LINK_CHECK_RECIPE or recipe_id in existing_recipes
+    ):
+        return recipe_path(recipe_id)
+    if len(code) != LEGACY_CODE_LENGTH:
+        return None
+    link = legacy_links(code).first()
+    if link is not None:
+        return link.base_link.replace('/api', '', 1)
+    return None
+
+
+def legacy_links(code):
+    """Ссылки, выданные до перехода на вычисляемые коды.
+
+    Таблица Link больше не пополняется, поэтому индекса по short_link
+    нет: ее читают только коды старой длины.
+    """
+    return Link.objects.filter(
+        short_link=f'http://{Site.objects.get_current().domain}/s/{code}'
+    )
+
+
+def recipe_exists(recipe_id):
+    return Recipe.objects.filter(pk=recipe_id)
+
+
+class ExistingRecipes:
+    """Проверка, что рецепт существует, через общий кэш API.
+
+    Найденный id запоминается вместе с версией тега recipe:<id>. Удаление
+    рецепта поднимает эту версию, и запись перестает читаться во всех
+    воркерах. Отсутствующие id ничего не пишут в кэш.
+    """
+
+    @staticmethod
+    def key(recipe_id):
+        return f'{PREFIX}:recipe-exists:{recipe_id}'
+
+    def __contains__(self, recipe_id):
+        tag = f'recipe:{recipe_id}'
+        cache = get_cache()
+        cached = cache.get_many([version_key(tag), self.key(recipe_id)])
+        version = cached.get(version_key(tag))
+        if version is not None and cached.get(self.key(recipe_id)) == version:
+            return True
+        if not recipe_exists(recipe_id).exists():
+            return False
+        if version is None:
+            # Версия заводится только для существующих рецептов, и после
+            # этого рецепт проверяется еще раз: удаление могло успеть
+            # завести версию раньше нас.
+            version, = current_versions([tag])
+            if not recipe_exists(recipe_id).exists():
+                return False
+        cache.set(
+            self.key(recipe_id), version, settings.SHORT_LINK_CACHE_TIMEOUT
+        )
+        return True
+
+
+existing_recipes = ExistingRecipes()
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import ingredients_imported
+from user.models import Subscribe
+
+from .cache import bump
+from .recipe_rows import refresh_documents
+
+User = get_user_model()
+
+
+def bump_on_commit(*tags):
+    transaction.on_commit(lambda: bump(*tags))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    bump_on_commit('recipes', f'recipe:{instance.pk}')
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredients_changed(instance, **kwargs):
+    bump_on_commit('recipes', f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_on_commit('recipes', f'recipe:{instance.pk}')
+    elif pk_set:
+        bump_on_commit('recipes', *(f'recipe:{pk}' for pk in pk_set))
+    else:
+        bump_on_commit('recipes', 'tags')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    bump_on_commit('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(ingredients_imported)
+def ingredient_changed(**kwargs):
+    bump_on_commit('ingredients')
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_delete, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def user_flags_changed(instance, **kwargs):
+    bump_on_commit(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def author_changed(instance, signal, created=False, update_fields=None,
+                   **kwargs):
+    """Сбрасывает документы рецептов автора, если изменилась его карточка.
+
+    Полный save() пользователя перечисляет в update_fields все поля,
+    поэтому после сохранения сравниваются сами значения публичных полей.
+    """
+    if created:
+        return
+    if signal is post_save and (
+        update_fields and not set(User.PUBLIC_FIELDS) & set(update_fields)
+        or not instance.public_fields_changed()
+    ):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        bump_on_commit(
+            'recipes', *(f'recipe:{pk}' for pk in recipe_ids)
+        )
+        if signal is post_save:
+            transaction.on_commit(lambda: refresh_documents(recipe_ids))
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import (GetShortLink, IngredientsViewSet, RecipeViewSet,
                     TagsViewSet, UserViewSet)
 
@@ -17,3 +19,10 @@ urlpatterns = [
     path('recipes/<int:recipe_id>/get-link/', GetShortLink.as_view()),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns.insert(0, path(
+        'recipes/download_shopping_cart/',
+        async_views.download_shopping_cart,
+        name='recipes-download-shopping-cart'
+    ))
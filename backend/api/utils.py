@@ -1,14 +1,88 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import fields
+from rest_framework.exceptions import ValidationError
+
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def check_image_limits(file):
+    """Проверяет размер файла и число пикселей по заголовку изображения.
+
+    Image.open читает только заголовок, так что слишком большое
+    изображение отклоняется до декодирования пикселей.
+    """
+    if file.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise ValidationError(
+            f'Размер изображения больше '
+            f'{settings.IMAGE_UPLOAD_MAX_BYTES} байт'
+        )
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width, height = float('inf'), 1
+    except Exception:
+        # Битые файлы отклонит сам ImageField.
+        return
+    finally:
+        file.seek(0)
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            f'Изображение больше {settings.IMAGE_UPLOAD_MAX_PIXELS} пикселей'
+        )
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл, который хранилище может переместить при сохранении.
+
+    close() у TemporaryUploadedFile не падает, если файла уже нет, поэтому
+    закрываем через него, а не через финализатор tempfile.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def decode_base64_image(data):
+    """Декодирует data URI частями во временный файл на диске."""
+    try:
+        header, encoded = data.split(';base64,', 1)
+    except ValueError:
+        raise ValidationError('Изображение должно быть в формате base64')
+    # Переносы строк и пробелы допустимы в base64 (RFC 2045), но
+    # validate=True их не пропускает, а части должны быть кратны 4 знакам.
+    encoded = ''.join(encoded.split())
+    if len(encoded) // 4 * 3 > settings.IMAGE_UPLOAD_MAX_BYTES + 3:
+        raise ValidationError(
+            f'Размер изображения больше '
+            f'{settings.IMAGE_UPLOAD_MAX_BYTES} байт'
+        )
+    content_type = header[len('data:'):]
+    upload = DecodedImageFile(
+        'photo.' + content_type.split('/')[-1], content_type, 0, None
+    )
+    try:
+        for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+            upload.write(base64.b64decode(
+                encoded[start:start + BASE64_CHUNK_SIZE], validate=True
+            ))
+    except binascii.Error:
+        upload.close()
+        raise ValidationError('Некорректная строка base64')
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
 
 
 class Base64ImageField(fields.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
-
+            data = decode_base64_image(data)
+        if hasattr(data, 'size') and hasattr(data, 'seek'):
+            check_image_limits(data)
         return super().to_internal_value(data)
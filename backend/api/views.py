@@ -1,12 +1,20 @@
-from django.db.models import Sum
-from django.http import Http404, HttpResponse
+from collections import defaultdict
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Link,
-                            Recipe, ShoppingCart, Tag)
+from recipes.catalogue import ingredient_index, tag_catalogue
+from recipes.counters import shift_recipes
+from recipes.models import (Favourite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, lock_users)
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
@@ -14,14 +22,23 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from user.models import Subscribe, User
 
-from .filters import IngredientFilter, RecipeFilter, get_short_url
-from .pagination import CustomPagination
+from .cache import AnonymousCacheMixin, ConditionalGetMixin
+from .filters import IngredientFilter, RecipeFilter
+from .pagination import CustomPagination, RecipePagination
+from .parsers import IMAGE_PARSERS
 from .permissions import IsAdminOrReadOnly, IsOwnerAdminOrReadOnly
+from .recipe_rows import RecipeRowsMixin
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (CustomUserSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeImageSerializer,
                           RecipeSerializer, RecipesShortSerializer,
-                          RecipeWriteSerializer, ShortLinkSerialiser,
-                          SubscribedSerislizer, SubscriptionsSerializer,
-                          TagSerializer, UserAvatarSerialiser)
+                          RecipeWriteSerializer, SubscribedSerislizer,
+                          SubscriptionsSerializer, TagSerializer,
+                          UserAvatarSerialiser, get_recipes_limit)
+from .shopping_list import (ROWS_PER_CHUNK, shopping_list_rows,
+                            stream_shopping_list)
+from .short_links import encode, existing_recipes, resolve
+from .signals import bump_on_commit
 
 
 class UserViewSet(UserViewSet):
@@ -90,19 +107,23 @@ class UserViewSet(UserViewSet):
         url_path="me/avatar",
         methods=["put", "delete"],
         permission_classes=(IsAuthenticated,),
+        parser_classes=IMAGE_PARSERS,
     )
     def avatar(self, request, *args, **kwargs):
         if request.method == "DELETE":
             request.user.avatar = None
             request.user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
-        if 'avatar' not in request.data:
+        data = request.data
+        if 'file' in data:
+            data = {'avatar': data['file']}
+        if 'avatar' not in data:
             return Response(
                 {"detail": "Поле 'avatar' должно быть заполнено."},
                 status=status.HTTP_400_BAD_REQUEST
             )
         serializer = UserAvatarSerialiser(
-            data=request.data,
+            data=data,
             instance=request.user
         )
         serializer.is_valid(raise_exception=True)
@@ -112,29 +133,37 @@ class UserViewSet(UserViewSet):
     @action(
         detail=False,
         methods=["get"],
-        permission_classes=(AllowAny,),
+        permission_classes=(IsAuthenticated,),
         url_path='subscriptions',
     )
     def subscriptions(self, request):
-        user = request.user
-        subscriptions = Subscribe.objects.filter(user=user)
+        subscriptions = self.subscriptions_queryset()
         page = self.paginate_queryset(subscriptions)
         if page is not None:
-            serializer = SubscriptionsSerializer(
-                page,
-                many=True,
-                context={'request': request}
-            )
-            return self.get_paginated_response(serializer.data)
+            subscriptions = page
+        previews = defaultdict(list)
+        for recipe in Recipe.objects.previews(
+            [subscription.author_id for subscription in subscriptions],
+            get_recipes_limit(request)
+        ):
+            previews[recipe.author_id].append(recipe)
         serializer = SubscriptionsSerializer(
             subscriptions,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipe_previews': previews}
         )
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
         return Response(serializer.data)
 
+    def subscriptions_queryset(self):
+        return Subscribe.objects.filter(
+            user=self.request.user
+        ).select_related('author').order_by('subscription_date', 'id')
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+
+class IngredientsViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                         ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -142,51 +171,127 @@ class IngredientsViewSet(ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     fields = ['^name']
 
+    def cache_tags(self):
+        return ('ingredients',)
+
+    def list(self, request, *args, **kwargs):
+        if 'name' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.conditional(self.autocomplete, request, *args, **kwargs)
+
+    def autocomplete(self, request, *args, **kwargs):
+        name = request.query_params['name']
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValidationError(
+                    {'limit': 'Должно быть целым положительным числом'}
+                )
+            limit = int(limit)
+        return Response(ingredient_index.search(name, limit))
+
 
-class TagsViewSet(ReadOnlyModelViewSet):
+class TagsViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                  ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsOwnerAdminOrReadOnly,)
 
+    def cache_tags(self):
+        return ('tags',)
+
+    def get_queryset(self):
+        return tag_catalogue.snapshot().tags
+
+    def get_object(self):
+        pk = self.kwargs['pk']
+        tag = tag_catalogue.get(int(pk)) if pk.isdigit() else None
+        if tag is None:
+            raise Http404
+        self.check_object_permissions(self.request, tag)
+        return tag
+
 
 class GetShortLink(APIView):
     permission_classes = (AllowAny,)
 
     def get(self, request, recipe_id):
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        short_url = get_short_url()
-        link_obj, _ = Link.objects.get_or_create(
-            recipe=recipe,
-            defaults={'base_link': recipe.get_absolute_url(),
-                      'short_link': short_url}
-        )
-        serializer = ShortLinkSerialiser(link_obj)
-        return Response(serializer.data)
-
-    def redirect_to_full_link(request, short_link):
-        try:
-            link_obj = Link.objects.get(
-                short_link="http:/localhost/s/" + short_link
+        if recipe_id not in existing_recipes:
+            raise Http404
+        return Response({
+            'short-link': request.build_absolute_uri(
+                reverse('short-link', kwargs={'code': encode(recipe_id)})
             )
-            full_link = link_obj.base_link.replace('/api', '', 1)
-            return redirect(full_link)
-        except Link.DoesNotExist:
-            return HttpResponse(
-                'Ссылка не найдена', status=status.HTTP_404_NOT_FOUND)
+        })
+
 
+def redirect_to_full_link(request, code):
+    path = resolve(code)
+    if path is None:
+        return HttpResponse(
+            'Ссылка не найдена', status=status.HTTP_404_NOT_FOUND)
+    return redirect(path)
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin, RecipeRowsMixin,
+                    ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsOwnerAdminOrReadOnly,)
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def cache_tags(self):
+        if self.action == 'retrieve':
+            return (f'recipe:{self.kwargs["pk"]}', 'tags', 'ingredients')
+        return ('recipes', 'tags', 'ingredients')
+
+    def user_cache_tags(self, user):
+        return (f'user:{user.pk}',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = queryset.defer('search_vector').with_related()
+            return queryset.with_user_flags(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.apply_deltas(
+            instance.shopping_cart.values_list('user_id', flat=True),
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount
+                in ShoppingListItem.objects.recipe_amounts(instance).items()
+            }
+        )
+        instance.delete()
+
+    @action(
+        detail=True,
+        methods=['PUT'],
+        parser_classes=IMAGE_PARSERS,
+    )
+    def image(self, request, pk):
+        recipe = self.get_object()
+        data = request.data
+        if 'file' in data:
+            data = {'image': data['file']}
+        serializer = RecipeImageSerializer(
+            recipe,
+            data=data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -197,7 +302,8 @@ class RecipeViewSet(ModelViewSet):
             request,
             pk,
             Favourite,
-            'В избранном нет рецепта'
+            'В избранном нет рецепта',
+            'В избранном уже есть рецепт'
         )
 
     @action(
@@ -210,9 +316,87 @@ class RecipeViewSet(ModelViewSet):
             request,
             pk,
             ShoppingCart,
-            'В списке покупок нет рецепта'
+            'В списке покупок нет рецепта',
+            'В списке покупок уже есть рецепт'
         )
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_method(request, Favourite)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_method(request, ShoppingCart)
+
+    def bulk_method(self, request, model):
+        """Добавляет или убирает сразу несколько рецептов.
+
+        Число запросов не зависит от числа рецептов. Сигналы есть только
+        у delete() и сбрасывают лишь кэш, поэтому счетчики, список покупок
+        и версия кэша пользователя обновляются здесь же. Строка пользователя
+        блокируется до чтения текущего состояния, как и в general_method:
+        иначе одновременное добавление того же рецепта учлось бы в
+        списке покупок дважды. Ответ — статус каждого id: added/exists,
+        removed/missing или not_found.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user = request.user
+        adding = request.method == 'POST'
+        with transaction.atomic():
+            lock_users([user.pk])
+            present = dict(Recipe.objects.filter(pk__in=ids).annotate(
+                present=Exists(model.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                ))
+            ).values_list('id', 'present'))
+            changed = [
+                pk for pk in ids if pk in present and present[pk] != adding
+            ]
+            if changed:
+                if adding:
+                    model.objects.bulk_create(
+                        [model(user=user, recipe_id=pk) for pk in changed]
+                    )
+                else:
+                    model.objects.filter(
+                        user=user, recipe_id__in=changed
+                    ).delete()
+                delta = 1 if adding else -1
+                shift_recipes(model, changed, delta)
+                if model is ShoppingCart:
+                    ShoppingListItem.objects.apply_deltas([user.pk], {
+                        ingredient_id: delta * amount
+                        for ingredient_id, amount in ShoppingListItem.objects
+                        .recipes_amounts(changed).items()
+                    })
+                bump_on_commit(f'user:{user.pk}')
+        statuses = (
+            {True: 'exists', False: 'added'} if adding
+            else {True: 'removed', False: 'missing'}
+        )
+        return Response([
+            {
+                'id': pk,
+                'status': statuses[present[pk]] if pk in present
+                else 'not_found'
+            }
+            for pk in ids
+        ])
+
     def general_method(
             self,
             request,
@@ -231,18 +415,23 @@ class RecipeViewSet(ModelViewSet):
             )
 
         if request.method == 'POST':
-            if model.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                return Response(
-                    {'errors': f'{error_message_post} \"{recipe.name}\"'},
-                    status=status.HTTP_400_BAD_REQUEST
+            with transaction.atomic():
+                lock_users([user.pk])
+                if model.objects.filter(
+                    user=user,
+                    recipe=recipe
+                ).exists():
+                    return Response(
+                        {'errors': f'{error_message_post} \"{recipe.name}\"'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                model.objects.create(
+                    user=user,
+                    recipe=recipe
                 )
-            model.objects.create(
-                user=user,
-                recipe=recipe
-            )
+                shift_recipes(model, [recipe.id], 1)
+                if model is ShoppingCart:
+                    ShoppingListItem.objects.add_recipe(user, recipe)
             serializer = RecipesShortSerializer(recipe)
             return Response(
                 serializer.data,
@@ -250,13 +439,18 @@ class RecipeViewSet(ModelViewSet):
             )
 
         elif request.method == 'DELETE':
-            obj = model.objects.filter(
-                user=user,
-                recipe=recipe
-            )
-            if obj.exists():
-                obj.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
+            with transaction.atomic():
+                lock_users([user.pk])
+                obj = model.objects.filter(
+                    user=user,
+                    recipe=recipe
+                )
+                if obj.exists():
+                    obj.delete()
+                    shift_recipes(model, [recipe.id], -1)
+                    if model is ShoppingCart:
+                        ShoppingListItem.objects.remove_recipe(user, recipe)
+                    return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': f'{error_message_get} \"{recipe.name}\"'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -264,46 +458,27 @@ class RecipeViewSet(ModelViewSet):
 
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-    @staticmethod
-    def ingredients_to_txt(ingredients):
-        shopping_list = ''
-        for ingredient in ingredients:
-            shopping_list += (
-                f"{ingredient['ingredient__name']}  - "
-                f"{ingredient['sum']}"
-                f"({ingredient['ingredient__measurement_unit']})\n"
-            )
-        return shopping_list
-
     @action(detail=False, methods=['GET'],
             permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_RENDERERS,
             url_path='download_shopping_cart',
             url_name='download_shopping_cart',
             )
     def download_shopping_cart(self, request):
         user = request.user
-        if not user.shopping_cart.exists():
+        rows = shopping_list_rows(user).iterator(chunk_size=ROWS_PER_CHUNK)
+        first_row = next(rows, None)
+        if first_row is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount'))
-
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            stream_shopping_list(
+                renderer.format, user, chain([first_row], rows)
+            ),
+            content_type=f'{renderer.media_type}; charset=utf-8'
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["total_amount"]}'
-            for ingredient in ingredients
-        ])
-
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
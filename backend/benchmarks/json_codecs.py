@@ -0,0 +1,143 @@
+"""Сравнение FastJSONRenderer/FastJSONParser со стандартными из DRF.
+
+Берет реальные ответы из настроенной базы — страницу рецептов и полный
+список ингредиентов — и тело создания рецепта с картинкой в base64.
+Для каждого проверяет, что байты и разобранные данные совпадают, и
+печатает время на одну операцию. Базу можно наполнить командами
+import_csv и generate_data.
+
+    DB_ENGINE=sqlite python benchmarks/json_codecs.py --page-size 50
+"""
+# isort: skip_file
+import argparse
+import base64
+import datetime
+import io
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from api.parsers import FastJSONParser  # noqa: E402
+from api.recipe_rows import recipe_values, serialize_recipes  # noqa: E402
+from api.renderers import FastJSONRenderer  # noqa: E402
+from api.serializers import IngredientSerializer  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from django.utils.translation import gettext_lazy  # noqa: E402
+from PIL import Image  # noqa: E402
+from recipes.models import Ingredient, Recipe  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--image-size', type=int, default=600,
+                        help='сторона картинки в теле запроса, пикселей')
+    parser.add_argument('--repeat', type=int, default=200)
+    return parser.parse_args()
+
+
+def image_body(side):
+    rng = random.Random(1)
+    image = Image.frombytes(
+        'RGB', (side, side), bytes(rng.getrandbits(8)
+                                   for _ in range(side * side * 3))
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return {
+        'name': 'Проверка', 'text': 'Описание', 'cooking_time': 10,
+        'tags': [1], 'ingredients': [{'id': 1, 'amount': 10}],
+        'image': f'data:image/png;base64,{encoded}',
+    }
+
+
+def payloads(args):
+    rows = list(recipe_values(
+        Recipe.objects.with_user_flags(None)
+    )[:args.page_size])
+    if not rows:
+        raise SystemExit('В базе нет рецептов: выполните generate_data')
+    return {
+        f'recipes page ({len(rows)})': {
+            'count': Recipe.objects.count(), 'next': None, 'previous': None,
+            'results': serialize_recipes(rows, None),
+        },
+        'ingredients (all)': IngredientSerializer(
+            Ingredient.objects.all(), many=True
+        ).data,
+        'special types': [
+            {
+                'decimal': Decimal('12.50'),
+                'datetime': timezone.now(),
+                'naive': datetime.datetime(2024, 7, 5, 17, 8, 1, 123456),
+                'date': datetime.date(2024, 7, 5),
+                'lazy': gettext_lazy('Рецепт'),
+                'separators': 'строка с разделителями',
+            }
+        ] * 100,
+    }
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def compare(name, slow, fast, repeat):
+    slow_result, slow_ms = timed(slow, repeat)
+    fast_result, fast_ms = timed(fast, repeat)
+    same = 'совпадает' if slow_result == fast_result else 'РАСХОДИТСЯ'
+    print(
+        f'{name:<32} json {slow_ms:8.3f} ms  orjson {fast_ms:8.3f} ms  '
+        f'x{slow_ms / fast_ms:5.1f}  {same}'
+    )
+    return slow_result == fast_result
+
+
+def main():
+    args = parse_args()
+    identical = True
+    slow_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+    for name, data in payloads(args).items():
+        identical &= compare(
+            f'render {name}',
+            lambda: slow_renderer.render(data),
+            lambda: fast_renderer.render(data),
+            args.repeat
+        )
+    bodies = {
+        f'parse recipe with {args.image_size}px image': slow_renderer.render(
+            image_body(args.image_size)
+        ),
+    }
+    slow_parser, fast_parser = JSONParser(), FastJSONParser()
+    for name, body in bodies.items():
+        print(f'{name}: {len(body) // 1024} КБ')
+        identical &= compare(
+            name,
+            lambda: slow_parser.parse(io.BytesIO(body)),
+            lambda: fast_parser.parse(io.BytesIO(body)),
+            args.repeat
+        )
+    if not identical:
+        raise SystemExit('Вывод быстрых кодеков отличается от стандартных')
+
+
+if __name__ == '__main__':
+    main()
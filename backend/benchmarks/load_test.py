@@ -0,0 +1,488 @@
+"""Нагрузочный прогон всех маршрутов api/urls.py через тестовый клиент Django.
+
+Сначала каждый маршрут вызывается хотя бы раз (маршруты без сценария
+выводятся предупреждением, чтобы новые ручки не выпадали из прогона), затем
+выполняется --requests сценариев по смеси --mix. Для каждой ручки считаются
+число запросов, ошибки, пропускная способность и p50/p95/p99; результаты
+можно сохранить в JSON (--json) и сравнить с прошлым прогоном (--baseline).
+
+По умолчанию создается временная тестовая база с небольшим набором данных;
+с --existing используется настроенная база как есть, например наполненная
+командой generate_data. Движок выбирается переменной DB_ENGINE
+(sqlite или postgresql).
+
+    DB_ENGINE=sqlite python benchmarks/load_test.py --requests 2000
+"""
+# isort: skip_file
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from api import urls as api_urls  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import URLPattern, URLResolver  # noqa: E402
+from PIL import Image  # noqa: E402
+from recipes.models import Favourite, Ingredient  # noqa: E402
+from recipes.models import IngredientInRecipe, Recipe  # noqa: E402
+from recipes.models import ShoppingCart, ShoppingListItem, Tag  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+from user.models import Subscribe, User  # noqa: E402
+
+DEFAULT_MIX = {
+    'anonymous': 45,
+    'autocomplete': 20,
+    'favorite': 15,
+    'cart': 10,
+    'subscriptions': 10,
+}
+PASSWORD = 'bench-Pa55word'
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 80, 40)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def seed(rng, users=30, recipes=300, ingredients=300):
+    """Небольшой набор данных для временной базы."""
+    Tag.objects.bulk_create(
+        Tag(name=name, slug=slug, color=color) for name, slug, color in (
+            ('Завтрак', 'breakfast', '#E26C2D'),
+            ('Обед', 'lunch', '#49B64E'),
+            ('Ужин', 'dinner', '#8775D2'),
+        )
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {number:04}', measurement_unit='г')
+        for number in range(ingredients)
+    )
+    User.objects.bulk_create(
+        User(
+            username=f'bench{number}', email=f'bench{number}@example.com',
+            first_name='Bench', last_name=str(number),
+        )
+        for number in range(users)
+    )
+    authors = list(User.objects.values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            name=f'Рецепт {number}', text='Нарезать, смешать и подать.',
+            author_id=rng.choice(authors[:max(1, users // 5)]),
+            cooking_time=rng.randint(5, 120),
+            image='recipes/images/bench.png',
+        )
+        for number in range(recipes)
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(
+            recipe_id=recipe_id, ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(ingredient_ids, rng.randint(3, 12))
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+    )
+    for user_id in authors:
+        for model in (Favourite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in rng.sample(recipe_ids, 5)
+            )
+        Subscribe.objects.bulk_create(
+            Subscribe(user_id=user_id, author_id=author_id)
+            for author_id in rng.sample(authors, 5) if author_id != user_id
+        )
+    ShoppingListItem.objects.rebuild()
+
+
+class Context:
+    """Клиенты, данные для запросов и замеры."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.anonymous = Client()
+        self.users = list(User.objects.order_by('id')[:50])
+        self.tokens = {
+            user.id: Token.objects.get_or_create(user=user)[0].key
+            for user in self.users
+        }
+        self.recipe_ids = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)[:500]
+        )
+        self.author_ids = list(
+            User.objects.order_by('-recipes_count').values_list(
+                'id', flat=True
+            )[:50]
+        )
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:500]
+        )
+        self.prefixes = sorted({
+            name[:2] for name in Ingredient.objects.values_list(
+                'name', flat=True
+            )[:500]
+        })
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.covered = set()
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def request(self, label, route, method, path, user=None, data=None,
+                expected=(200, 201, 204), **extra):
+        client = self.anonymous
+        if user is not None:
+            client = Client(
+                HTTP_AUTHORIZATION=f'Token {self.tokens[user.id]}'
+            )
+        if data is not None:
+            extra.update(data=json.dumps(data),
+                         content_type='application/json')
+        started = time.perf_counter()
+        response = getattr(client, method.lower())(path, **extra)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        self.latencies[label].append(elapsed)
+        self.covered.add((route, method))
+        if response.status_code not in expected:
+            self.errors[label] += 1
+        return response
+
+
+def recipe_payload(ctx):
+    return {
+        'name': 'Нагрузочный рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': png_base64(),
+        'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in ctx.rng.sample(ctx.ingredient_ids, 4)
+        ],
+    }
+
+
+def coverage_pass(ctx):
+    """Вызывает каждый маршрут хотя бы раз.
+
+    Письма и подтверждения djoser вызываются с пустыми данными: важен сам
+    маршрут, а не успешный ответ.
+    """
+    user = ctx.user()
+    author = next(author for author in ctx.author_ids if author != user.id)
+    recipe_id = ctx.recipe_ids[0]
+    tag_id = Tag.objects.values_list('id', flat=True).first()
+    r = ctx.request
+    r('GET /api/', 'api-root', 'GET', '/api/')
+    r('POST /api/auth/token/login/', 'login', 'POST',
+      '/api/auth/token/login/', expected=(400,), data={})
+    r('POST /api/auth/token/logout/', 'logout', 'POST',
+      '/api/auth/token/logout/', expected=(401,))
+    r('GET /api/recipes/{id}/get-link/', 'get-link', 'GET',
+      f'/api/recipes/{recipe_id}/get-link/')
+    r('POST /api/users/', 'users-list', 'POST', '/api/users/', data={
+        'email': f'new{ctx.rng.random()}@example.com',
+        'username': f'new{ctx.rng.randrange(10 ** 9)}',
+        'first_name': 'Новый', 'last_name': 'Пользователь',
+        'password': PASSWORD,
+    })
+    r('GET /api/users/', 'users-list', 'GET', '/api/users/')
+    r('GET /api/users/{id}/', 'users-detail', 'GET',
+      f'/api/users/{author}/')
+    r('GET /api/users/me/', 'users-me', 'GET', '/api/users/me/', user=user)
+    r('PUT /api/users/me/avatar/', 'users-avatar', 'PUT',
+      '/api/users/me/avatar/', user=user, data={'avatar': png_base64()})
+    r('DELETE /api/users/me/avatar/', 'users-avatar', 'DELETE',
+      '/api/users/me/avatar/', user=user)
+    for method in ('PUT', 'PATCH', 'DELETE'):
+        r(f'{method} /api/users/me/', 'users-me', method, '/api/users/me/',
+          user=user, expected=(200, 400), data={})
+        r(f'{method} /api/users/{{id}}/', 'users-detail', method,
+          f'/api/users/{author}/', user=user, expected=(403,), data={})
+    r('POST /api/users/set_password/', 'users-set-password', 'POST',
+      '/api/users/set_password/', user=user, expected=(400,), data={})
+    for name, path in (
+        ('users-activation', 'activation'),
+        ('users-resend-activation', 'resend_activation'),
+        ('users-reset-password', 'reset_password'),
+        ('users-reset-password-confirm', 'reset_password_confirm'),
+        ('users-reset-username', 'reset_email'),
+        ('users-reset-username-confirm', 'reset_email_confirm'),
+        ('users-set-username', 'set_email'),
+    ):
+        r(f'POST /api/users/{path}/', name, 'POST', f'/api/users/{path}/',
+          user=user, expected=(400, 404), data={})
+    r('GET /api/tags/{id}/', 'tags-detail', 'GET', f'/api/tags/{tag_id}/')
+    r('GET /api/ingredients/{id}/', 'ingredients-detail', 'GET',
+      f'/api/ingredients/{ctx.ingredient_ids[0]}/')
+    response = r('POST /api/recipes/', 'recipes-list', 'POST',
+                 '/api/recipes/', user=user, data=recipe_payload(ctx))
+    new_recipe = response.json()['id']
+    r('PATCH /api/recipes/{id}/', 'recipes-detail', 'PATCH',
+      f'/api/recipes/{new_recipe}/', user=user, data=recipe_payload(ctx))
+    r('PUT /api/recipes/{id}/', 'recipes-detail', 'PUT',
+      f'/api/recipes/{new_recipe}/', user=user, data=recipe_payload(ctx))
+    r('PUT /api/recipes/{id}/image/', 'recipes-image', 'PUT',
+      f'/api/recipes/{new_recipe}/image/', user=user,
+      data={'image': png_base64()})
+    r('DELETE /api/recipes/{id}/', 'recipes-detail', 'DELETE',
+      f'/api/recipes/{new_recipe}/', user=user)
+    for scenario in SCENARIOS.values():
+        scenario(ctx)
+
+
+def anonymous(ctx):
+    r = ctx.request
+    r('GET /api/recipes/', 'recipes-list', 'GET',
+      f'/api/recipes/?page={ctx.rng.randint(1, 5)}')
+    r('GET /api/recipes/?pagination=cursor', 'recipes-list', 'GET',
+      '/api/recipes/?pagination=cursor')
+    r('GET /api/recipes/?tags=', 'recipes-list', 'GET',
+      f'/api/recipes/?tags={ctx.rng.choice(ctx.tag_slugs)}')
+    r('GET /api/recipes/?author=', 'recipes-list', 'GET',
+      f'/api/recipes/?author={ctx.rng.choice(ctx.author_ids)}')
+    r('GET /api/recipes/{id}/', 'recipes-detail', 'GET',
+      f'/api/recipes/{ctx.rng.choice(ctx.recipe_ids)}/')
+    r('GET /api/tags/', 'tags-list', 'GET', '/api/tags/')
+
+
+def autocomplete(ctx):
+    prefix = ctx.rng.choice(ctx.prefixes)
+    for length in range(1, len(prefix) + 1):
+        ctx.request('GET /api/ingredients/?name=', 'ingredients-list', 'GET',
+                    f'/api/ingredients/?name={prefix[:length]}')
+
+
+def favorite(ctx):
+    user = ctx.user()
+    recipe_id = ctx.rng.choice(ctx.recipe_ids)
+    path = f'/api/recipes/{recipe_id}/favorite/'
+    ctx.request('GET /api/recipes/?is_favorited=1', 'recipes-list', 'GET',
+                '/api/recipes/?is_favorited=1', user=user)
+    ctx.request('POST /api/recipes/{id}/favorite/', 'recipes-favorite',
+                'POST', path, user=user, expected=(201, 400))
+    ctx.request('DELETE /api/recipes/{id}/favorite/', 'recipes-favorite',
+                'DELETE', path, user=user, expected=(204, 400))
+
+
+def cart(ctx):
+    user = ctx.user()
+    recipe_id = ctx.rng.choice(ctx.recipe_ids)
+    path = f'/api/recipes/{recipe_id}/shopping_cart/'
+    ctx.request('POST /api/recipes/{id}/shopping_cart/',
+                'recipes-shopping-cart', 'POST', path, user=user,
+                expected=(201, 400))
+    ctx.request('GET /api/recipes/download_shopping_cart/',
+                'recipes-download_shopping_cart', 'GET',
+                '/api/recipes/download_shopping_cart/', user=user)
+    ctx.request('DELETE /api/recipes/{id}/shopping_cart/',
+                'recipes-shopping-cart', 'DELETE', path, user=user,
+                expected=(204, 400))
+
+
+def subscriptions(ctx):
+    user = ctx.user()
+    author = ctx.rng.choice(ctx.author_ids)
+    ctx.request('GET /api/users/subscriptions/', 'users-subscriptions',
+                'GET', '/api/users/subscriptions/?recipes_limit=3', user=user)
+    if author == user.id:
+        return
+    path = f'/api/users/{author}/subscribe/'
+    ctx.request('POST /api/users/{id}/subscribe/', 'users-subscribe', 'POST',
+                path, user=user, expected=(201, 400))
+    ctx.request('DELETE /api/users/{id}/subscribe/', 'users-subscribe',
+                'DELETE', path, user=user, expected=(204, 400))
+
+
+SCENARIOS = {
+    'anonymous': anonymous,
+    'autocomplete': autocomplete,
+    'favorite': favorite,
+    'cart': cart,
+    'subscriptions': subscriptions,
+}
+
+
+def api_routes():
+    """Пары (имя маршрута, метод) из api/urls.py."""
+    routes = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern):
+                actions = getattr(pattern.callback, 'actions', None)
+                view = getattr(pattern.callback, 'cls', None)
+                if actions:
+                    methods = [
+                        method for method in actions if method != 'head'
+                    ]
+                elif view is not None:
+                    methods = [
+                        method for method in view.http_method_names
+                        if hasattr(view, method)
+                        and method not in ('head', 'options')
+                    ]
+                else:
+                    methods = ['get']
+                name = pattern.name or 'get-link'
+                routes.update((name, method.upper()) for method in methods)
+
+    walk(api_urls.urlpatterns)
+    return routes
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def summarize(ctx, elapsed):
+    endpoints = {}
+    for label, latencies in sorted(ctx.latencies.items()):
+        endpoints[label] = {
+            'requests': len(latencies),
+            'errors': ctx.errors[label],
+            'rps': round(len(latencies) / sum(latencies), 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    total = sum(len(latencies) for latencies in ctx.latencies.values())
+    return {
+        'requests': total,
+        'errors': sum(ctx.errors.values()),
+        'seconds': round(elapsed, 2),
+        'rps': round(total / elapsed, 1),
+        'endpoints': endpoints,
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'Нет сценария {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='сколько сценариев выполнить')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='веса сценариев: anonymous=45,cart=10,...')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--existing', action='store_true',
+                        help='использовать настроенную базу с ее данными')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    parser.add_argument('--baseline', help='JSON прошлого прогона')
+    return parser.parse_args()
+
+
+def print_report(result, baseline=None):
+    print(f"{'endpoint':<46}{'req':>7}{'err':>5}{'rps':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, row in result['endpoints'].items():
+        line = (
+            f"{label:<46}{row['requests']:>7}{row['errors']:>5}"
+            f"{row['rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+            f"{row['p99_ms']:>9}"
+        )
+        before = (baseline or {}).get('endpoints', {}).get(label)
+        if before:
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms']
+            line += f'  p95 {change:+.0%}'
+        print(line)
+    print(f"Всего {result['requests']} запросов за {result['seconds']} с, "
+          f"{result['rps']} rps, ошибок {result['errors']}")
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    if not args.existing:
+        seed(rng)
+    ctx = Context(rng)
+    names, weights = zip(*args.mix.items())
+    started = time.perf_counter()
+    coverage_pass(ctx)
+    for _ in range(args.requests):
+        SCENARIOS[rng.choices(names, weights)[0]](ctx)
+    result = summarize(ctx, time.perf_counter() - started)
+    result['meta'] = {
+        'engine': connection.vendor,
+        'existing': args.existing,
+        'mix': args.mix,
+        'seed': args.seed,
+        'scenarios': args.requests,
+    }
+    missing = sorted(api_routes() - ctx.covered)
+    for name, method in missing:
+        print(f'Маршрут без сценария: {method} {name}', file=sys.stderr)
+    result['uncovered'] = [f'{method} {name}' for name, method in missing]
+    return result
+
+
+def main():
+    args = parse_args()
+    setup_test_environment()
+    old_name = None
+    if not args.existing:
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+    try:
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                result = run(args)
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+    print_report(result, baseline)
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps(result, indent=2, ensure_ascii=False)
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Сравнение профилей WSGI и ASGI под медленными клиентами.
+
+Для каждого профиля поднимает gunicorn с gunicorn.conf.py, открывает
+--slow-clients соединений, которые по байту присылают заголовки (или тело
+загрузки аватара, если передан --token), и параллельно измеряет задержку
+быстрых запросов к --probe-path. Синхронный воркер занят медленным клиентом
+целиком, поэтому под WSGI быстрые запросы начинают ждать или отваливаться
+по таймауту, а под ASGI продолжают обслуживаться.
+
+Запуск из каталога backend (нужна база из DJANGO_SETTINGS_MODULE):
+
+    python benchmarks/slow_clients.py --slow-clients 20 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SLOW_INTERVAL = 0.5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'],
+                        choices=['wsgi', 'asgi'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--slow-clients', type=int, default=20)
+    parser.add_argument('--probes', type=int, default=4,
+                        help='одновременных быстрых клиентов')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=3,
+                        help='таймаут быстрого запроса, секунд')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--probe-path', default='/api/tags/')
+    parser.add_argument('--token',
+                        help='токен: медленные клиенты грузят аватар')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    return parser.parse_args()
+
+
+def start_server(mode, args):
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        GUNICORN_BIND=f'127.0.0.1:{args.port}',
+        GUNICORN_WORKERS=str(args.workers),
+    )
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env, start_new_session=True
+    )
+
+
+async def wait_for_port(port, limit=15):
+    deadline = time.monotonic() + limit
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.2)
+            continue
+        writer.close()
+        return
+    raise RuntimeError(f'Сервер не поднялся на порту {port}')
+
+
+async def slow_client(port, token, stop_at):
+    """Держит соединение, присылая запрос по байту раз в SLOW_INTERVAL."""
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    if token:
+        head = (
+            'PUT /api/users/me/avatar/ HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            f'Authorization: Token {token}\r\n'
+            'Content-Type: image/png\r\nContent-Length: 1000000\r\n\r\n'
+        )
+        writer.write(head.encode())
+        trickle = b'\0'
+    else:
+        writer.write(b'GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n')
+        trickle = b'X'
+    try:
+        while time.monotonic() < stop_at:
+            await writer.drain()
+            await asyncio.sleep(SLOW_INTERVAL)
+            writer.write(trickle)
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def probe(port, path, timeout, stop_at, latencies, failures):
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+        'Connection: close\r\n\r\n'
+    ).encode()
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection('127.0.0.1', port), timeout
+            )
+            writer.write(request)
+            await asyncio.wait_for(reader.read(), timeout)
+            writer.close()
+        except (OSError, asyncio.TimeoutError):
+            failures.append(time.monotonic() - started)
+            continue
+        latencies.append(time.monotonic() - started)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+async def run_mode(mode, args):
+    server = start_server(mode, args)
+    try:
+        await wait_for_port(args.port)
+        stop_at = time.monotonic() + args.duration
+        latencies, failures = [], []
+        await asyncio.gather(
+            *(slow_client(args.port, args.token, stop_at)
+              for _ in range(args.slow_clients)),
+            *(probe(args.port, args.probe_path, args.timeout, stop_at,
+                    latencies, failures)
+              for _ in range(args.probes)),
+        )
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'slow_clients': args.slow_clients,
+        'completed': len(latencies),
+        'failed': len(failures),
+        'rps': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1)
+        if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1)
+        if latencies else None,
+    }
+
+
+def main():
+    args = parse_args()
+    results = [asyncio.run(run_mode(mode, args)) for mode in args.modes]
+    for result in results:
+        print(
+            f"{result['mode']}: {result['completed']} ok, "
+            f"{result['failed']} failed, {result['rps']} rps, "
+            f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""Общие помощники для моделей приложений user и recipes."""
+
+
+def update_fields_without(instance, skip):
+    """Поля для save() уже сохраненного объекта, кроме полей skip.
+
+    Счетчики меняются UPDATE с F(), и полное сохранение объекта,
+    прочитанного раньше, затирало бы их старыми значениями.
+    """
+    deferred = instance.get_deferred_fields()
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key
+        and field.name not in skip
+        and field.attname not in deferred
+    ]
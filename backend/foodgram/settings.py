@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,43 @@ DATABASES = {
     }
 }
 
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv(
+                'SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')
+            ),
+        }
+    }
+    # SQLite не поддерживает INCLUDE в индексах: покрывающий индекс
+    # IngredientInRecipe там создается без amount, это ожидаемо.
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Кэш API общий для всех воркеров: версии тегов, ответы и блокировки
+# должны быть видны каждому процессу. Кэш в памяти процесса (LocMemCache)
+# допустим только при GUNICORN_WORKERS=1, иначе gunicorn не запустится.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10_000)),
+        },
+    }
+}
+
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 60))
+API_CACHE_LOCK_TIMEOUT = 5
+RECIPE_DOCUMENT_TIMEOUT = int(os.getenv('RECIPE_DOCUMENT_TIMEOUT', 86400))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -116,6 +155,27 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CSV_DIR = os.path.join(BASE_DIR, 'data')
 
+METRICS_REPEATED_QUERY_THRESHOLD = int(
+    os.getenv('METRICS_REPEATED_QUERY_THRESHOLD', 5)
+)
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 8))
+
+SHORT_LINK_CHECK_RECIPE = (
+    os.getenv('SHORT_LINK_CHECK_RECIPE', 'False').lower() == 'true'
+)
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 86400))
+# Ключ перестановки id в коды коротких ссылок. Не зависит от SECRET_KEY:
+# при его смене уже выданные ссылки продолжают работать.
+SHORT_LINK_KEY = os.getenv('SHORT_LINK_KEY', 'foodgram-short-links')
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 25_000_000))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
@@ -123,7 +183,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
-
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -140,3 +208,9 @@ DJOSER = {
         'user_list': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
     },
 }
+
+# Документы рецептов хранятся в кэше API: с кэшем в памяти процесса
+# (LocMemCache) настройку нужно выключить, иначе gunicorn не запустится.
+RECIPE_ROWS_SERIALIZER = (
+    os.getenv('RECIPE_ROWS_SERIALIZER', 'True').lower() == 'true'
+)
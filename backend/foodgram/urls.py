@@ -1,11 +1,22 @@
+from api import async_views, views
+from api.metrics import metrics_view
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    re_path(
+        r'^s/(?P<code>[0-9A-Za-z]+)/?$',
+        (
+            async_views.redirect_to_full_link if settings.ASYNC_VIEWS
+            else views.redirect_to_full_link
+        ),
+        name='short-link'
+    ),
 ]
 
 if settings.DEBUG:
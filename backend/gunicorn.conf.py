@@ -0,0 +1,25 @@
+"""Профили запуска gunicorn.
+
+SERVER_MODE=wsgi (по умолчанию) — синхронные воркеры на foodgram.wsgi.
+SERVER_MODE=asgi — воркеры uvicorn на foodgram.asgi: медленные клиенты
+ждут в цикле событий, а не занимают воркер целиком.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def on_starting(server):
+    """До запуска воркеров проверяет, что кэш API общий для них."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    import django
+    django.setup()
+    from api.cache import check_shared_cache
+    check_shared_cache(server.cfg.workers)
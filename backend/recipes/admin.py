@@ -1,7 +1,15 @@
 from django.contrib import admin
+from django.db import transaction
 
+from .counters import shift_recipes
 from .models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+
+
+def cart_user_ids(recipe_ids):
+    return set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True))
 
 
 @admin.register(Ingredient)
@@ -25,22 +33,92 @@ class IngredientInRecipeInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'cooking_time')
+    """Пересобирает списки покупок при правках рецептов через админку.
+
+    Такие правки идут мимо приращений списков, поэтому списки
+    пользователей, у которых рецепт в корзине, считаются заново.
+    """
+
+    list_display = (
+        'name', 'author', 'cooking_time', 'favorites_count',
+        'shopping_carts_count'
+    )
     search_fields = ('name', 'author__username')
     inlines = [IngredientInRecipeInline]
     list_filter = ('tags',)
     ordering = ('-id',)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            ShoppingListItem.objects.rebuild(cart_user_ids([form.instance.pk]))
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        user_ids = cart_user_ids([obj.pk])
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild(user_ids)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        user_ids = cart_user_ids(queryset.values('pk'))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(user_ids)
+
+
+class RecipeCounterAdmin(admin.ModelAdmin):
+    """Поддерживает счетчики рецептов при правках через админку."""
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if change and 'recipe' in form.changed_data:
+            shift_recipes(self.model, [form.initial['recipe']], -1)
+        super().save_model(request, obj, form, change)
+        if not change or 'recipe' in form.changed_data:
+            shift_recipes(self.model, [obj.recipe_id], 1)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        shift_recipes(self.model, [obj.recipe_id], -1)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        shift_recipes(self.model, recipe_ids, -1)
+
 
 @admin.register(Favourite)
-class FavouriteAdmin(admin.ModelAdmin):
+class FavouriteAdmin(RecipeCounterAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
     ordering = ('user',)
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RecipeCounterAdmin):
+    """Вдобавок к счетчикам пересобирает списки покупок пользователей."""
+
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
     ordering = ('user',)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        user_ids = {obj.user_id}
+        if change and 'user' in form.changed_data:
+            user_ids.add(form.initial['user'])
+        ShoppingListItem.objects.rebuild(user_ids)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild([obj.user_id])
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(user_ids)
@@ -0,0 +1,57 @@
+"""Быстрая пакетная запись строк в обход ORM.
+
+В PostgreSQL строки передаются через COPY, в остальных базах — пачками
+INSERT через executemany. Сигналы и save() моделей не вызываются.
+"""
+import io
+from itertools import islice
+
+from django.db import connection
+
+
+def batches(rows, batch_size):
+    """Разбивает итерируемое на списки не длиннее batch_size."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY строк в таблицу PostgreSQL одним обращением."""
+    buffer = io.StringIO(''.join(
+        '\t'.join(copy_value(value) for value in row) + '\n'
+        for row in rows
+    ))
+    cursor.cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer
+    )
+
+
+def write_rows(table, columns, rows, batch_size):
+    """Пишет строки пачками и возвращает их число."""
+    written = 0
+    with connection.cursor() as cursor:
+        for batch in batches(rows, batch_size):
+            if connection.vendor == 'postgresql':
+                copy_rows(cursor, table, columns, batch)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({", ".join(columns)}) '
+                    f'VALUES ({placeholders})',
+                    batch
+                )
+            written += len(batch)
+    return written
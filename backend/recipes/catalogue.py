@@ -0,0 +1,156 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+from types import MappingProxyType
+from typing import NamedTuple
+
+from api.cache import current_versions
+
+from .models import Ingredient, Tag
+
+
+def shared_version(tag):
+    """Версия тега кэша API, общая для всех процессов.
+
+    Меняется после записи в любом воркере или команде manage.py, поэтому
+    снимок, построенный при другой версии, устарел.
+    """
+    return current_versions([tag])[0]
+
+
+class IngredientIndex:
+    """Отсортированный в памяти процесса индекс ингредиентов по названию.
+
+    Строится из таблицы Ingredient при первом обращении и сбрасывается
+    сигналами при изменении ингредиентов. Изменения из других процессов
+    (например, import_csv) видны по версии тега кэша ingredients: индекс
+    перестраивается, как только она отличается от версии при построении.
+    Поэтому подсказки совпадают с ETag, который считается по той же
+    версии.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = None
+        self._rows = None
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._rows = None
+
+    @staticmethod
+    def queryset():
+        return Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        )
+
+    def _build(self):
+        rows = sorted(
+            (
+                {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+                for pk, name, measurement_unit in self.queryset()
+            ),
+            key=lambda row: (row['name'].lower(), row['name'], row['id'])
+        )
+        return [row['name'].lower() for row in rows], rows
+
+    def _snapshot(self):
+        version = shared_version('ingredients')
+        with self._lock:
+            if self._keys is None or self._version != version:
+                self._keys, self._rows = self._build()
+                self._version = version
+            return self._keys, self._rows
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix.
+
+        Регистр не учитывается. Ключ, равный префиксу, сортируется раньше
+        своих продолжений, поэтому точные совпадения названия идут первыми,
+        остальные — по алфавиту.
+        """
+        keys, rows = self._snapshot()
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return rows[start:end]
+
+
+ingredient_index = IngredientIndex()
+
+
+class TagSnapshot(NamedTuple):
+    tags: tuple
+    by_id: MappingProxyType
+    by_slug: MappingProxyType
+
+
+class TagCatalogue:
+    """Неизменяемый снимок тегов процесса: список и словари по id и слагу.
+
+    Тегов единицы, а нужны они почти каждому запросу: списку тегов,
+    фильтру ленты по слагам и проверке id при записи рецепта. Снимок
+    помнит версию тега кэша tags, при которой построен, и перестраивается,
+    как только общая версия изменилась: так списки тегов из разных
+    воркеров не расходятся с их ETag. Если тег не найден, снимок один раз
+    перечитывается, но не чаще раза в секунду: так виден тег, версия
+    которого еще не поднята, а перебор несуществующих id не нагружает базу.
+    """
+
+    MISS_INTERVAL = 1
+
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+        self._version = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _build(self):
+        tags = tuple(Tag.objects.order_by('id'))
+        return TagSnapshot(
+            tags=tags,
+            by_id=MappingProxyType({tag.pk: tag for tag in tags}),
+            by_slug=MappingProxyType({tag.slug: tag for tag in tags}),
+        )
+
+    def snapshot(self, max_age=None):
+        """Актуальный снимок; max_age — перестроить и более старый."""
+        version = shared_version('tags')
+        with self._lock:
+            if (
+                self._snapshot is None
+                or self._version != version
+                or max_age is not None
+                and time.monotonic() - self._built_at > max_age
+            ):
+                self._snapshot = self._build()
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._snapshot
+
+    def _find(self, mapping, key):
+        tag = getattr(self.snapshot(), mapping).get(key)
+        if tag is None:
+            tag = getattr(
+                self.snapshot(max_age=self.MISS_INTERVAL), mapping
+            ).get(key)
+        return tag
+
+    def get(self, pk):
+        """Тег по id или None."""
+        return self._find('by_id', pk)
+
+    def get_by_slug(self, slug):
+        """Тег по слагу или None."""
+        return self._find('by_slug', slug)
+
+
+tag_catalogue = TagCatalogue()
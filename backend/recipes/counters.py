@@ -0,0 +1,80 @@
+"""Денормализованные счетчики рецептов и пользователей.
+
+Счетчики меняются атомарным UPDATE с F() в той же транзакции, что и
+запись, от которой они зависят: рецепты автора и подписчики — через
+сигналы, избранное и корзина — явно в местах записи, чтобы массовые
+операции обходились одним UPDATE на рецепт. Расхождения, например после
+правок в обход API, исправляет команда reconcile_counters.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from user.models import Subscribe
+
+from .models import Favourite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+RECIPE_COUNTERS = {
+    Favourite: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+
+
+def shift(queryset, field, delta):
+    """Сдвигает счетчик field у строк queryset на delta, не ниже нуля."""
+    if delta:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def shift_recipes(model, recipe_ids, delta):
+    """Сдвигает счетчик model (Favourite или ShoppingCart) у рецептов.
+
+    recipe_ids может содержать повторы: каждый повтор — еще один delta.
+    """
+    field = RECIPE_COUNTERS[model]
+    by_step = {}
+    for recipe_id, times in Counter(recipe_ids).items():
+        by_step.setdefault(times, []).append(recipe_id)
+    for times, ids in by_step.items():
+        shift(Recipe.objects.filter(pk__in=ids), field, delta * times)
+
+
+def forget_user(user):
+    """Убирает из счетчиков рецептов избранное и корзину пользователя."""
+    for model in RECIPE_COUNTERS:
+        shift_recipes(
+            model,
+            model.objects.filter(user=user).values_list(
+                'recipe_id', flat=True
+            ),
+            -1
+        )
+
+
+def count_of(queryset, group_by):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{group_by: OuterRef('pk')}).order_by().values(
+                group_by
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def expected_counters():
+    """Пары (queryset, {поле: выражение}) с точными значениями счетчиков."""
+    return (
+        (Recipe.objects.all(), {
+            field: count_of(model.objects.all(), 'recipe')
+            for model, field in RECIPE_COUNTERS.items()
+        }),
+        (User.objects.all(), {
+            'recipes_count': count_of(Recipe.objects.all(), 'author'),
+            'subscribers_count': count_of(Subscribe.objects.all(), 'author'),
+        }),
+    )
@@ -0,0 +1,116 @@
+from api.cache import get_cache
+from api.recipe_rows import document_key, recipe_values, serialize_recipes
+from api.serializers import RecipeSerializer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from recipes.models import Favourite, IngredientInRecipe, Recipe, ShoppingCart
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from user.models import Subscribe, User
+
+BATCH_SIZE = 200
+
+
+def viewers(count):
+    """Аноним и пользователи с избранным, корзиной или подписками."""
+    active = User.objects.filter(
+        Q(Exists(Favourite.objects.filter(user=OuterRef('pk'))))
+        | Q(Exists(ShoppingCart.objects.filter(user=OuterRef('pk'))))
+        | Q(Exists(Subscribe.objects.filter(user=OuterRef('pk'))))
+    ).order_by('pk')[:count]
+    return [AnonymousUser(), *active]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка JSON рецептов из serialize_recipes с RecipeSerializer '
+        'байт в байт'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10,
+                            help='сколько пользователей проверить')
+        parser.add_argument('--limit', type=int,
+                            help='сколько последних рецептов проверить')
+        parser.add_argument('--host',
+                            default=settings.ALLOWED_HOSTS[0].strip(),
+                            help='хост для абсолютных ссылок на картинки')
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        if options['limit'] is not None:
+            recipe_ids = recipe_ids[:options['limit']]
+        self.checked = self.mismatched = 0
+        for user in viewers(options['users']):
+            self.compare(recipe_ids, user, options['host'])
+        self.compare_authorless(recipe_ids, options['host'])
+        if self.mismatched:
+            raise CommandError(
+                f'Расхождений: {self.mismatched} из {self.checked}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Совпадают: {self.checked}'))
+
+    def compare(self, recipe_ids, user, host):
+        renderer = JSONRenderer()
+        request = Request(APIRequestFactory().get(
+            '/api/recipes/', HTTP_HOST=host
+        ))
+        request.user = user
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            recipes = Recipe.objects.filter(
+                pk__in=recipe_ids[start:start + BATCH_SIZE]
+            ).with_user_flags(user)
+            expected = RecipeSerializer(
+                recipes.with_related(), many=True,
+                context={'request': request}
+            ).data
+            actual = serialize_recipes(
+                list(recipe_values(recipes)), request
+            )
+            if len(expected) != len(actual):
+                raise CommandError('Разное число рецептов в ответах')
+            for old, new in zip(expected, actual):
+                self.checked += 1
+                old_json = renderer.render(old)
+                new_json = renderer.render(new)
+                if old_json != new_json:
+                    self.mismatched += 1
+                    self.stdout.write(
+                        f'Рецепт {new["id"]} для {user}:\n'
+                        f'  RecipeSerializer:  {old_json.decode()}\n'
+                        f'  serialize_recipes: {new_json.decode()}'
+                    )
+
+    def compare_authorless(self, recipe_ids, host):
+        """Рецепт удаленного автора: копия первого рецепта без автора.
+
+        Копия создается в транзакции, которая затем откатывается, а ее
+        документ удаляется из кэша: id после отката может достаться
+        новому рецепту.
+        """
+        if not recipe_ids:
+            return
+        source = Recipe.objects.get(pk=recipe_ids[0])
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                name=source.name, text=source.text, image=source.image,
+                cooking_time=source.cooking_time, author=None
+            )
+            recipe.tags.set(source.tags.all())
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient_id=item.ingredient_id,
+                    amount=item.amount
+                )
+                for item in source.ingredient_list.all()
+            )
+            try:
+                for user in viewers(1):
+                    self.compare([recipe.pk], user, host)
+            finally:
+                get_cache().delete(document_key(recipe.pk))
+                transaction.set_rollback(True)
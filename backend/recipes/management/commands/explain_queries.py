@@ -0,0 +1,175 @@
+import re
+from urllib.parse import urlencode
+
+from api.recipe_rows import (document_ingredient_rows, document_recipe_rows,
+                             document_tag_rows, recipe_values)
+from api.shopping_list import shopping_list_rows
+from api.short_links import legacy_links, recipe_exists
+from api.views import RecipeViewSet, UserViewSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.query import RawQuerySet
+from recipes.catalogue import ingredient_index
+from recipes.models import Recipe, ShoppingListItem
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from user.models import Subscribe, User
+
+PAGE_SIZE = 7
+RECIPES_LIMIT = 3
+
+PROBLEMS = {
+    'postgresql': (
+        (re.compile(r'^(-> +)?(Parallel )?Seq Scan on (?P<table>\w+)'),
+         'последовательное чтение {table}'),
+        (re.compile(r'^(-> +)?Sort '), 'сортировка'),
+    ),
+    'sqlite': (
+        (re.compile(r'\bSCAN (TABLE )?(?P<table>\w+)(?!.*\bUSING\b)'),
+         'последовательное чтение {table}'),
+        (re.compile(r'\bUSE TEMP B-TREE\b'), 'сортировка'),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN для типовых запросов API: показывает планы и отмечает '
+        'последовательные чтения и сортировки. Запускать на наполненной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Выполнить запросы (EXPLAIN ANALYZE, только PostgreSQL)',
+        )
+        parser.add_argument(
+            '--force-index',
+            action='store_true',
+            help=(
+                'Запретить планировщику seq scan (только PostgreSQL), '
+                'чтобы на маленькой базе увидеть, есть ли подходящий индекс'
+            ),
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='Завершиться с ошибкой, если найдены проблемы',
+        )
+
+    @staticmethod
+    def view(viewset, action, user, params=None, **kwargs):
+        """Вьюсет в том виде, в каком его видит запрос с параметрами."""
+        path = '/'
+        if params:
+            path = f'/?{urlencode(params)}'
+        request = Request(APIRequestFactory().get(path))
+        request.user = user
+        return viewset(
+            action=action, request=request, format_kwarg=None, args=(),
+            kwargs=kwargs
+        )
+
+    def recipe_page(self, user, params=None):
+        view = self.view(RecipeViewSet, 'list', user, params)
+        return recipe_values(
+            view.filter_queryset(view.get_queryset())
+        )[:PAGE_SIZE]
+
+    def queries(self):
+        """Запросы, которые выполняют представления API.
+
+        Querysets берутся из тех же вьюсетов, фильтров и функций, что и в
+        обработке запросов, поэтому план показывает текущую форму запроса.
+        """
+        user = User.objects.filter(
+            pk__in=ShoppingListItem.objects.values('user_id')
+        ).order_by('pk').first() or User.objects.order_by('pk').first()
+        recipe = Recipe.objects.order_by('pk').first()
+        tag = recipe and recipe.tags.order_by('pk').first()
+        if None in (user, recipe, tag):
+            raise CommandError(
+                'Нужны хотя бы один пользователь и рецепт с тегом'
+            )
+        page_ids = [row['id'] for row in self.recipe_page(user)]
+        detail = self.view(RecipeViewSet, 'retrieve', user, pk=recipe.pk)
+        subscriptions = self.view(UserViewSet, 'subscriptions', user)
+        author_ids = list(
+            Subscribe.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )[:PAGE_SIZE]
+        ) or [recipe.author_id]
+        return (
+            ('GET /api/ingredients/?name= (построение индекса)',
+             ingredient_index.queryset()),
+            ('GET /api/recipes/', self.recipe_page(user)),
+            ('GET /api/recipes/?tags=',
+             self.recipe_page(user, {'tags': tag.slug})),
+            ('GET /api/recipes/?is_favorited=1',
+             self.recipe_page(user, {'is_favorited': 1})),
+            ('GET /api/recipes/?search=',
+             self.recipe_page(user, {'search': recipe.name.split()[0]})),
+            ('GET /api/recipes/{id}/', recipe_values(
+                detail.filter_queryset(detail.get_queryset())
+            ).filter(pk=recipe.pk)),
+            ('документы рецептов: теги', document_tag_rows(page_ids)),
+            ('документы рецептов: ингредиенты',
+             document_ingredient_rows(page_ids)),
+            ('документы рецептов: рецепты и авторы',
+             document_recipe_rows(page_ids)),
+            ('GET /api/users/subscriptions/',
+             subscriptions.subscriptions_queryset()[:PAGE_SIZE]),
+            ('GET /api/users/subscriptions/ (рецепты авторов)',
+             Recipe.objects.previews(author_ids, RECIPES_LIMIT)),
+            ('GET /s/{code}/', recipe_exists(recipe.pk)),
+            ('GET /s/{code}/ (старые ссылки)', legacy_links('abcd')),
+            ('GET /api/recipes/download_shopping_cart/',
+             shopping_list_rows(user)),
+        )
+
+    def explain(self, queryset, analyze):
+        if not isinstance(queryset, RawQuerySet):
+            if analyze:
+                return queryset.explain(analyze=True)
+            return queryset.explain()
+        options = {'analyze': True} if analyze else {}
+        prefix = connection.ops.explain_query_prefix(**options)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {queryset.raw_query}', queryset.params)
+            return '\n'.join(
+                ' '.join(map(str, row)) for row in cursor.fetchall()
+            )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        postgres = vendor == 'postgresql'
+        if (options['analyze'] or options['force_index']) and not postgres:
+            raise CommandError(
+                '--analyze и --force-index есть только в PostgreSQL'
+            )
+        patterns = PROBLEMS.get(vendor, ())
+        flagged = 0
+        with transaction.atomic():
+            if options['force_index']:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in self.queries():
+                plan = self.explain(queryset, options['analyze'])
+                problems = [
+                    message.format(**match.groupdict())
+                    for line in plan.splitlines()
+                    for pattern, message in patterns
+                    for match in [pattern.search(line.strip())]
+                    if match
+                ]
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(plan)
+                for problem in problems:
+                    self.stdout.write(self.style.WARNING(f'  ! {problem}'))
+                flagged += bool(problems)
+        if flagged and options['strict']:
+            raise CommandError(f'Запросов с проблемами в плане: {flagged}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов, с проблемами: {flagged}'
+        ))
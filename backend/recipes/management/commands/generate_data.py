@@ -0,0 +1,298 @@
+import random
+from bisect import bisect
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from time import perf_counter
+
+from api.cache import bump
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.bulk import write_rows
+from recipes.counters import shift
+from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from user.models import Subscribe, User
+
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'каша', 'рагу', 'омлет', 'блины',
+    'котлеты', 'паста', 'плов', 'борщ', 'шарлотка', 'сырники', 'жаркое',
+    'быстрый', 'домашний', 'острый', 'летний', 'сытный', 'постный', 'нежный',
+)
+PASSWORD = 'generated-password'
+# Все даты отсчитываются от фиксированного момента и берутся из того же
+# генератора, что и остальные данные: при одном --seed они совпадают.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+def moment(rng):
+    """Случайный момент в течение года после EPOCH."""
+    return EPOCH + timedelta(seconds=rng.randrange(YEAR_SECONDS))
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса рангов 1..size по закону Ципфа."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def draw(rng, cum_weights, count):
+    """count различных индексов, чаще — с малым рангом."""
+    total = cum_weights[-1]
+    chosen = set()
+    for _ in range(count * 4):
+        if len(chosen) >= count:
+            break
+        chosen.add(bisect(cum_weights, rng.random() * total))
+    return chosen
+
+
+def heavy_tail(rng, mean, limit):
+    """Целое с тяжелым хвостом (Парето) и заданным средним."""
+    alpha = 2.0
+    return min(limit, int(rng.paretovariate(alpha) * mean * (alpha - 1)
+                          / alpha))
+
+
+def add_counts(model, field, counts, batch_size):
+    """Прибавляет counts {pk: n} к счетчику: один UPDATE на каждое n."""
+    by_count = defaultdict(list)
+    for pk, count in counts.items():
+        by_count[count].append(pk)
+    for count, pks in by_count.items():
+        for start in range(0, len(pks), batch_size):
+            shift(
+                model.objects.filter(pk__in=pks[start:start + batch_size]),
+                field, count
+            )
+
+
+def new_ids(model, after):
+    return list(
+        model.objects.filter(pk__gt=after).order_by('pk').values_list(
+            'pk', flat=True
+        )
+    )
+
+
+def last_id(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических пользователей, рецептов, избранного, '
+        'корзин и подписок для нагрузочных замеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=3,
+                            help='минимальное число тегов')
+        parser.add_argument('--favorites', type=float, default=10,
+                            help='среднее число избранных на пользователя')
+        parser.add_argument('--carts', type=float, default=3,
+                            help='среднее число рецептов в корзине')
+        parser.add_argument('--subscriptions', type=float, default=5,
+                            help='среднее число подписок на пользователя')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='показатель Ципфа для популярности')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def step(self, message, started):
+        self.stdout.write(f'{message} за {perf_counter() - started:.1f} с')
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Каталог ингредиентов пуст, сначала выполните import_csv'
+            )
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        skew = options['skew']
+        prefix = f'gen{options["seed"]}'
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с seed {options["seed"]} уже есть, выберите другой'
+            )
+        with transaction.atomic():
+            tag_ids = self.make_tags(options['tags'])
+            user_ids = self.make_users(
+                rng, prefix, options['users'], batch_size
+            )
+            recipe_ids = self.make_recipes(
+                rng, user_ids, ingredient_ids, tag_ids, options['recipes'],
+                skew, batch_size
+            )
+            self.make_links(rng, user_ids, recipe_ids, options, batch_size)
+            started = perf_counter()
+            ShoppingListItem.objects.rebuild(batch_size=batch_size)
+            self.step('Списки покупок пересобраны', started)
+        # Строки писались мимо сигналов: закэшированные ответы API о
+        # рецептах сбрасываются явно. Новых пользователей в кэше еще нет.
+        bump('recipes', 'tags')
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы'))
+
+    def make_tags(self, count):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'Тег {number}',
+                slug=f'tag-{number}',
+                color=f'#{number * 40503 % 0xFFFFFF:06X}'
+            )
+            for number in range(existing, count)
+        )
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def make_users(self, rng, prefix, count, batch_size):
+        started = perf_counter()
+        after = last_id(User)
+        password = make_password(PASSWORD)
+        write_rows(
+            User._meta.db_table,
+            ('username', 'email', 'first_name', 'last_name', 'password',
+             'avatar', 'role', 'is_superuser', 'is_staff', 'is_active',
+             'date_joined', 'recipes_count', 'subscribers_count'),
+            (
+                (f'{prefix}_{number}', f'{prefix}_{number}@example.com',
+                 'Пользователь', str(number), password, '', 'user',
+                 False, False, True, moment(rng), 0, 0)
+                for number in range(count)
+            ),
+            batch_size
+        )
+        self.step(f'Пользователей: {count}', started)
+        return new_ids(User, after)
+
+    def make_recipes(self, rng, user_ids, ingredient_ids, tag_ids, count,
+                     skew, batch_size):
+        started = perf_counter()
+        after = last_id(Recipe)
+        authors = zipf_cum_weights(len(user_ids), skew)
+        recipes_count = Counter()
+
+        def recipes():
+            for number in range(count):
+                author = user_ids[bisect(authors, rng.random() * authors[-1])]
+                recipes_count[author] += 1
+                name = ' '.join(rng.sample(WORDS, 2)).capitalize()
+                yield (
+                    f'{name} {number}', author,
+                    ' '.join(rng.choices(WORDS, k=30)),
+                    'recipes/images/generated.png', rng.randint(5, 180),
+                    moment(rng),
+                    '', 0, 0
+                )
+
+        write_rows(
+            Recipe._meta.db_table,
+            ('name', 'author_id', 'text', 'image', 'cooking_time',
+             'pub_date', 'direct_link', 'favorites_count',
+             'shopping_carts_count'),
+            recipes(),
+            batch_size
+        )
+        recipe_ids = new_ids(Recipe, after)
+        add_counts(User, 'recipes_count', recipes_count, batch_size)
+        self.step(f'Рецептов: {len(recipe_ids)}', started)
+
+        started = perf_counter()
+        popular = list(ingredient_ids)
+        rng.shuffle(popular)
+        ingredients = zipf_cum_weights(len(popular), skew)
+        written = write_rows(
+            IngredientInRecipe._meta.db_table,
+            ('recipe_id', 'ingredient_id', 'amount'),
+            (
+                (recipe_id, popular[index], rng.randint(1, 500))
+                for recipe_id in recipe_ids
+                for index in sorted(draw(
+                    rng, ingredients, round(rng.triangular(2, 20, 7))
+                ))
+            ),
+            batch_size
+        )
+        self.step(f'Ингредиентов в рецептах: {written}', started)
+
+        started = perf_counter()
+        through = Recipe.tags.through
+        written = write_rows(
+            through._meta.db_table,
+            ('recipe_id', 'tag_id'),
+            (
+                (recipe_id, tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rng.sample(
+                    tag_ids, rng.randint(1, min(3, len(tag_ids)))
+                )
+            ),
+            batch_size
+        )
+        self.step(f'Тегов у рецептов: {written}', started)
+        return recipe_ids
+
+    def make_links(self, rng, user_ids, recipe_ids, options, batch_size):
+        if not recipe_ids:
+            return
+        skew = options['skew']
+        # Популярность рецептов не зависит от порядка их создания.
+        popular = list(recipe_ids)
+        rng.shuffle(popular)
+        recipes = zipf_cum_weights(len(popular), skew)
+        for model, field, mean in (
+            (Favourite, 'favorites_count', options['favorites']),
+            (ShoppingCart, 'shopping_carts_count', options['carts']),
+        ):
+            started = perf_counter()
+            rows = [
+                (user_id, popular[index])
+                for user_id in user_ids
+                for index in sorted(draw(
+                    rng, recipes, heavy_tail(rng, mean, len(popular))
+                ))
+            ]
+            write_rows(
+                model._meta.db_table, ('user_id', 'recipe_id'), rows,
+                batch_size
+            )
+            add_counts(
+                Recipe, field, Counter(recipe_id for _, recipe_id in rows),
+                batch_size
+            )
+            self.step(f'{model._meta.verbose_name_plural}: {len(rows)}',
+                      started)
+
+        # Авторы с малым рангом — самые плодовитые, на них и подписываются.
+        started = perf_counter()
+        authors = zipf_cum_weights(len(user_ids), skew)
+        rows = [
+            (user_id, user_ids[index], moment(rng))
+            for user_id in user_ids
+            for index in sorted(draw(
+                rng, authors,
+                heavy_tail(rng, options['subscriptions'], len(user_ids))
+            ))
+            if user_ids[index] != user_id
+        ]
+        write_rows(
+            Subscribe._meta.db_table,
+            ('user_id', 'author_id', 'subscription_date'), rows, batch_size
+        )
+        add_counts(
+            User, 'subscribers_count',
+            Counter(author_id for _, author_id, _ in rows), batch_size
+        )
+        self.step(f'Подписок: {len(rows)}', started)
@@ -1,38 +1,174 @@
 import csv
+import json
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.bulk import batches, copy_rows
 from recipes.models import Ingredient
+from recipes.signals import ingredients_imported
 
-ModelsCSV = {
-    Ingredient: 'ingredients.csv',
-}
+DEFAULT_FILE = 'ingredients.csv'
 
 EXPECTED_HEADER = ['name', 'measurement_unit']
 
+STAGING_TABLE = 'ingredient_import'
+
+
+def read_csv(path):
+    with open(path, mode='r', encoding='utf-8') as csv_file:
+        reader = csv.DictReader(csv_file)
+        if reader.fieldnames != EXPECTED_HEADER:
+            raise CommandError(
+                'Неверный формат файла: неправильные заголовки полей.')
+        yield from reader
+
+
+def read_json(path):
+    with open(path, mode='r', encoding='utf-8') as json_file:
+        data = json.load(json_file)
+    if not isinstance(data, list):
+        raise CommandError('Неверный формат файла: ожидается список.')
+    for row in data:
+        if not isinstance(row, dict) or sorted(row) != sorted(
+            EXPECTED_HEADER
+        ):
+            raise CommandError(
+                'Неверный формат файла: неправильные поля ингредиента.')
+        yield row
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def key(name, measurement_unit):
+    """Ключ ингредиента: название и единица без учета регистра."""
+    return name.lower(), measurement_unit.lower()
+
+
+def unique_rows(batch):
+    """Очищенные строки пачки без повторов ключа и число повторов."""
+    rows = {}
+    for row in batch:
+        name = row['name'].strip()
+        measurement_unit = row['measurement_unit'].strip()
+        if not name or not measurement_unit:
+            raise CommandError(f'Пустое поле в строке {row}')
+        rows.setdefault(key(name, measurement_unit), (name, measurement_unit))
+    return list(rows.values()), len(batch) - len(rows)
+
+
+def existing_ingredients():
+    """Ингредиенты базы по ключу; lower() в SQLite не знает кириллицы."""
+    return {
+        key(ingredient.name, ingredient.measurement_unit): ingredient
+        for ingredient in Ingredient.objects.only(
+            'name', 'measurement_unit'
+        ).iterator()
+    }
+
+
+def upsert_orm(existing, rows):
+    """Вставка и обновление пачки через ORM. Возвращает (новых, измененных).
+    """
+    to_create, to_update = [], []
+    for name, measurement_unit in rows:
+        ingredient = existing.get(key(name, measurement_unit))
+        if ingredient is None:
+            ingredient = Ingredient(
+                name=name, measurement_unit=measurement_unit
+            )
+            existing[key(name, measurement_unit)] = ingredient
+            to_create.append(ingredient)
+        elif (ingredient.name, ingredient.measurement_unit) != (
+            name, measurement_unit
+        ):
+            ingredient.name = name
+            ingredient.measurement_unit = measurement_unit
+            to_update.append(ingredient)
+    Ingredient.objects.bulk_create(to_create)
+    Ingredient.objects.bulk_update(to_update, ['name', 'measurement_unit'])
+    return len(to_create), len(to_update)
+
+
+def upsert_copy(cursor, rows):
+    """То же для PostgreSQL: COPY во временную таблицу и два запроса."""
+    table = Ingredient._meta.db_table
+    cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+    copy_rows(cursor, STAGING_TABLE, EXPECTED_HEADER, rows)
+    cursor.execute(
+        f'UPDATE {table} AS ingredient '
+        'SET name = staged.name, measurement_unit = staged.measurement_unit '
+        f'FROM {STAGING_TABLE} AS staged '
+        'WHERE lower(ingredient.name) = lower(staged.name) '
+        'AND lower(ingredient.measurement_unit) = '
+        'lower(staged.measurement_unit) '
+        'AND (ingredient.name, ingredient.measurement_unit) <> '
+        '(staged.name, staged.measurement_unit)'
+    )
+    updated = cursor.rowcount
+    cursor.execute(
+        f'INSERT INTO {table} (name, measurement_unit) '
+        f'SELECT staged.name, staged.measurement_unit FROM {STAGING_TABLE} '
+        'AS staged WHERE NOT EXISTS ('
+        f'SELECT 1 FROM {table} AS ingredient '
+        'WHERE lower(ingredient.name) = lower(staged.name) '
+        'AND lower(ingredient.measurement_unit) = '
+        'lower(staged.measurement_unit))'
+    )
+    return cursor.rowcount, updated
+
 
 class Command(BaseCommand):
-    help = 'Импорт данных из csv файлов'
+    help = (
+        'Импорт ингредиентов из csv или json файла. Существующие '
+        'ингредиенты не удаляются: совпадающие по названию и единице '
+        'измерения обновляются, остальные добавляются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=str(Path(settings.CSV_DIR) / DEFAULT_FILE),
+            help='путь к ingredients.csv или ingredients.json'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
 
     def handle(self, *args, **options):
-        for model, csv_files in ModelsCSV.items():
-            model.objects.all().delete()
-            path_to_file = f'{settings.CSV_DIR}/{csv_files}'
-            print(f'Начат импорт данных из файла {path_to_file}')
-            with open(
-                path_to_file,
-                mode='r',
-                encoding='utf-8',
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-
-                header = reader.fieldnames
-                if header != EXPECTED_HEADER:
-                    raise ValueError(
-                        'Неверный формат файла: неправильные заголовки полей.')
-
-                model.objects.bulk_create(model(**data) for data in reader)
-            self.stdout.write(
-                f'Завершен импорт данных в модель {model.__name__}'
-            )
-            return 'Импорт всех данных завершен.'
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        self.stdout.write(f'Начат импорт данных из файла {path}')
+        inserted = updated = unchanged = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            existing = None
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'CREATE TEMP TABLE {STAGING_TABLE} '
+                    '(name varchar(200), measurement_unit varchar(1000)) '
+                    'ON COMMIT DROP'
+                )
+            else:
+                existing = existing_ingredients()
+            for batch in batches(reader(path), options['batch_size']):
+                rows, repeated = unique_rows(batch)
+                if connection.vendor == 'postgresql':
+                    created, changed = upsert_copy(cursor, rows)
+                else:
+                    created, changed = upsert_orm(existing, rows)
+                inserted += created
+                updated += changed
+                unchanged += len(rows) - created - changed + repeated
+        if inserted or updated:
+            ingredients_imported.send(sender=Ingredient)
+        self.stdout.write(
+            f'Завершен импорт данных в модель {Ingredient.__name__}: '
+            f'добавлено {inserted}, обновлено {updated}, '
+            f'без изменений {unchanged}'
+        )
+        return 'Импорт всех данных завершен.'
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчет списков покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить списки покупок, ничего не меняя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='id пользователя, можно указать несколько раз',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['check']:
+            ShoppingListItem.objects.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
+            return
+
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.expected(user_ids).iterator()
+        }
+        stored = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in stored.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        mismatches = sorted(
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидается {expected.get((user_id, ingredient_id), 0)}, '
+                f'в таблице {actual.get((user_id, ingredient_id), 0)}'
+            )
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatches)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок совпадают'))
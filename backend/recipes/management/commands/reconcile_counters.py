@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from recipes.counters import expected_counters
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Сверка и пересчет счетчиков рецептов и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счетчики, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for queryset, counters in expected_counters():
+            model = queryset.model
+            mismatches = queryset.annotate(**{
+                f'expected_{field}': expression
+                for field, expression in counters.items()
+            })
+            condition = Q()
+            for field in counters:
+                condition |= ~Q(**{field: F(f'expected_{field}')})
+            fields = [
+                value for field in counters
+                for value in (field, f'expected_{field}')
+            ]
+            rows = mismatches.filter(condition).values_list('pk', *fields)
+            pks = []
+            for pk, *values in rows.iterator():
+                pks.append(pk)
+                self.stdout.write(
+                    f'{model._meta.verbose_name} {pk}: ' + ', '.join(
+                        f'{field} {actual} -> {expected}'
+                        for field, actual, expected
+                        in zip(counters, values[::2], values[1::2])
+                    )
+                )
+            drifted += len(pks)
+            if options['check']:
+                continue
+            with transaction.atomic():
+                for start in range(0, len(pks), BATCH_SIZE):
+                    queryset.filter(
+                        pk__in=pks[start:start + BATCH_SIZE]
+                    ).update(**counters)
+        if options['check'] and drifted:
+            raise CommandError(f'Расхождений в счетчиках: {drifted}')
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Счетчики совпадают'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Счетчики пересчитаны, исправлено строк: {drifted}'
+            ))
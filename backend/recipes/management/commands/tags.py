@@ -1,3 +1,4 @@
+from api.cache import bump
 from django.core.management import BaseCommand
 from recipes.models import Tag
 
@@ -11,4 +12,7 @@ class Command(BaseCommand):
             {'name': 'Ужин', 'color': '#8775D2', 'slug': 'supper'},
             {'name': 'Завтрак', 'color': '#674EA7', 'slug': 'breakfast'}]
         Tag.objects.bulk_create(Tag(**tag) for tag in data)
+        # bulk_create не шлет сигналов: снимки тегов воркеров сбрасываются
+        # сменой версии.
+        bump('tags')
         self.stdout.write(self.style.SUCCESS('Все тэги загружены!'))
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:34
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, group_by):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{group_by: OuterRef('pk')}).order_by().values(
+                group_by
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favourite = apps.get_model('recipes', 'Favourite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('user', 'User')
+    Subscribe = apps.get_model('user', 'Subscribe')
+    Recipe.objects.update(
+        favorites_count=count_of(Favourite.objects.all(), 'recipe'),
+        shopping_carts_count=count_of(ShoppingCart.objects.all(), 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=count_of(Recipe.objects.all(), 'author'),
+        subscribers_count=count_of(Subscribe.objects.all(), 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_vector'),
+        ('user', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
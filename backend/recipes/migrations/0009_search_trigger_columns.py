@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# search_vector пересчитывается только при изменении названия или описания:
+# счетчики рецепта обновляются часто, и триггер на любой UPDATE заново
+# разбирал текст при каждом из них.
+NAME_TEXT_TRIGGER = """
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector();
+"""
+
+ANY_COLUMN_TRIGGER = """
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+BEFORE INSERT OR UPDATE ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector();
+"""
+
+
+def on_postgresql(sql):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            on_postgresql(NAME_TEXT_TRIGGER),
+            on_postgresql(ANY_COLUMN_TRIGGER)
+        ),
+    ]
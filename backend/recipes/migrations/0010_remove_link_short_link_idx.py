@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_search_trigger_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='link',
+            name='link_short_link_idx',
+        ),
+    ]
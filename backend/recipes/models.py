@@ -1,8 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import connections, models, transaction
+from django.db.models import (BooleanField, Case, Exists, F, FloatField,
+                              OuterRef, Prefetch, Q, Sum, UniqueConstraint,
+                              Value, When, Window)
+from django.db.models.functions import RowNumber
+from foodgram.db import update_fields_without
 from rest_framework.reverse import reverse
+from user.models import Subscribe
 
 User = get_user_model()
 
@@ -21,6 +28,13 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        indexes = (
+            models.Index(
+                fields=('name',),
+                name='ingredient_name_prefix_idx',
+                opclasses=('varchar_pattern_ops',)
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}[:15], {self.measurement_unit}[:15]'
@@ -57,6 +71,97 @@ class Tag(models.Model):
         return self.name[:15]
 
 
+SEARCH_CONFIG = 'russian'
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Автор, теги и ингредиенты страницы рецептов за три запроса.
+
+        Теги идут по id, ингредиенты — в порядке добавления в рецепт.
+        """
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Флаги избранного, корзины и подписки в виде EXISTS-подзапросов."""
+        if user is None or user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')
+            ))
+        )
+
+    def search(self, text):
+        """Рецепты, подходящие под запрос, от более релевантных к менее.
+
+        В PostgreSQL ищет по search_vector (название и описание, русская
+        морфология), который поддерживает триггер; в остальных базах —
+        LIKE по названию и описанию, совпадения в названии выше.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            query = SearchQuery(
+                text, config=SEARCH_CONFIG, search_type='websearch'
+            )
+            return self.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F('search_vector'), query)
+            ).order_by('-search_rank', '-pub_date', '-id')
+        return self.filter(
+            Q(name__icontains=text) | Q(text__icontains=text)
+        ).annotate(
+            search_rank=Case(
+                When(name__icontains=text, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField()
+            )
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+    def previews(self, author_ids, limit=None):
+        """Последние limit рецептов каждого автора одним запросом.
+
+        Рецепты нумеруются ROW_NUMBER() в окне по автору, отбор по номеру
+        делается во внешнем запросе.
+        """
+        recipes = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return recipes
+        sql, params = recipes.annotate(
+            preview_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).order_by().values(
+            'id', 'name', 'image', 'cooking_time', 'author_id',
+            'preview_number'
+        ).query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) previews '
+            f'WHERE preview_number <= %s ORDER BY preview_number',
+            (*params, limit)
+        )
+
+
 class Recipe(models.Model):
     name = models.CharField(
         'Название',
@@ -103,9 +208,29 @@ class Recipe(models.Model):
         verbose_name='Cсылка на рецепт',
         blank=True
     )
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    COUNTERS = ('favorites_count', 'shopping_carts_count')
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_feed_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -115,6 +240,15 @@ class Recipe(models.Model):
     def get_absolute_url(self):
         return reverse('api:recipes-detail', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and (
+            kwargs.get('update_fields') is None
+        ):
+            kwargs['update_fields'] = update_fields_without(
+                self, self.COUNTERS
+            )
+        super().save(*args, **kwargs)
+
 
 class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -139,6 +273,13 @@ class IngredientInRecipe(models.Model):
     )
 
     class Meta:
+        indexes = (
+            models.Index(
+                fields=('recipe', 'ingredient'),
+                name='ingredient_in_recipe_idx',
+                include=('amount',)
+            ),
+        )
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
 
@@ -208,6 +349,157 @@ class ShoppingCart(models.Model):
         )
 
 
+def lock_users(user_ids):
+    """Блокирует строки пользователей до конца транзакции.
+
+    Так записи в избранное, корзину и список покупок одного пользователя
+    идут по очереди: select_for_update по строкам списка не защищает от
+    двух одновременных вставок одной новой позиции. Строки берутся по
+    возрастанию pk, чтобы транзакции с несколькими пользователями не
+    блокировали друг друга навстречу.
+    """
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+class ShoppingListItemManager(models.Manager):
+
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавляет deltas {ingredient_id: amount} к спискам user_ids.
+
+        Строки с неположительным итогом удаляются, так что в таблице
+        хранятся только реальные позиции списка покупок.
+        """
+        deltas = {
+            ingredient_id: amount
+            for ingredient_id, amount in deltas.items() if amount
+        }
+        user_ids = set(user_ids)
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            lock_users(user_ids)
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids,
+                    ingredient_id__in=deltas
+                )
+            }
+            to_create, to_update, to_delete = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, amount in deltas.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if amount > 0:
+                            to_create.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                amount=amount
+                            ))
+                    elif item.amount + amount > 0:
+                        item.amount += amount
+                        to_update.append(item)
+                    else:
+                        to_delete.append(item.pk)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ['amount'])
+            self.filter(pk__in=to_delete).delete()
+
+    @staticmethod
+    def recipe_amounts(recipe):
+        return dict(IngredientInRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'))
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        """Количества ингредиентов нескольких рецептов, сложенные вместе."""
+        return dict(IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).order_by())
+
+    def add_recipe(self, user, recipe):
+        self.apply_deltas([user.pk], self.recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.apply_deltas([user.pk], {
+            ingredient_id: -amount
+            for ingredient_id, amount in self.recipe_amounts(recipe).items()
+        })
+
+    def expected(self, user_ids=None):
+        """Списки покупок, посчитанные заново по корзинам.
+
+        Условие на корзину одно: второй filter() по той же связи добавил
+        бы еще одно соединение и умножил количества.
+        """
+        if user_ids is None:
+            queryset = IngredientInRecipe.objects.filter(
+                recipe__shopping_cart__isnull=False
+            )
+        else:
+            queryset = IngredientInRecipe.objects.filter(
+                recipe__shopping_cart__user_id__in=user_ids
+            )
+        return queryset.values_list(
+            'recipe__shopping_cart__user_id', 'ingredient_id'
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        with transaction.atomic():
+            queryset = self.all()
+            if user_ids is not None:
+                lock_users(user_ids)
+                queryset = queryset.filter(user_id__in=user_ids)
+            queryset.delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for user_id, ingredient_id, amount
+                    in self.expected(user_ids).iterator()
+                ),
+                batch_size=batch_size
+            )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
 class Link(models.Model):
     recipe = models.OneToOneField(
         Recipe,
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from user.models import Subscribe
+
+from .catalogue import ingredient_index, tag_catalogue
+from .counters import forget_user, shift
+from .models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+ingredients_imported = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(ingredients_imported)
+def reset_ingredient_index(**kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_tag_catalogue(**kwargs):
+    transaction.on_commit(tag_catalogue.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def count_author_recipes(instance, created=None, **kwargs):
+    if created is False:
+        return
+    shift(
+        User.objects.filter(pk=instance.author_id),
+        'recipes_count',
+        1 if created else -1
+    )
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def count_subscribers(instance, created=None, **kwargs):
+    if created is False:
+        return
+    shift(
+        User.objects.filter(pk=instance.author_id),
+        'subscribers_count',
+        1 if created else -1
+    )
+
+
+@receiver(pre_delete, sender=User)
+def forget_deleted_user(instance, **kwargs):
+    forget_user(instance)
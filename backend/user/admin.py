@@ -12,7 +12,9 @@ class UserAdmin(BaseUserAdmin):
         'first_name',
         'last_name',
         'avatar',
-        'role',)
+        'role',
+        'recipes_count',
+        'subscribers_count',)
     list_editable = ('role',)
     search_fields = ('username', 'email')
     list_filter = ()
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_auto_20240712_2006'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['user', 'subscription_date', 'id'], name='subscription_feed_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
+from foodgram.db import update_fields_without
 
 USER = 'user'
 ADMIN = 'admin'
@@ -48,6 +49,16 @@ class User(AbstractUser):
         choices=ROLES,
         default=USER
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -57,6 +68,10 @@ class User(AbstractUser):
         'password'
     ]
 
+    COUNTERS = ('recipes_count', 'subscribers_count')
+    # Поля карточки автора в ответах о рецептах.
+    PUBLIC_FIELDS = ('username', 'email', 'first_name', 'last_name', 'avatar')
+
     class Meta:
         ordering = ('username',)
         verbose_name = "Пользователь"
@@ -65,6 +80,40 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._public_values = instance.public_values()
+        return instance
+
+    def public_values(self):
+        """Значения загруженных публичных полей; у файла — его имя."""
+        deferred = self.get_deferred_fields()
+        return {
+            name: getattr(getattr(self, name), 'name', getattr(self, name))
+            for name in self.PUBLIC_FIELDS if name not in deferred
+        }
+
+    def public_fields_changed(self):
+        """Изменились ли публичные поля с чтения из базы или save()."""
+        saved = getattr(self, '_public_values', None)
+        if saved is None:
+            return True
+        return any(
+            name not in saved or saved[name] != value
+            for name, value in self.public_values().items()
+        )
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and (
+            kwargs.get('update_fields') is None
+        ):
+            kwargs['update_fields'] = update_fields_without(
+                self, self.COUNTERS
+            )
+        super().save(*args, **kwargs)
+        self._public_values = self.public_values()
+
 
 class Subscribe(models.Model):
     user = models.ForeignKey(
@@ -92,6 +141,12 @@ class Subscribe(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = (
+            models.Index(
+                fields=('user', 'subscription_date', 'id'),
+                name='subscription_feed_idx'
+            ),
+        )
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 